@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Historical backfill
+Loads holdings for a date range from each ETF's history_url, one page
+per TWSE trading day (trading_calendar.py). The (ETF, date) grid is cut
+into shards that async workers pull from a queue; pages parse in the
+scraper's process pool and go through its batching saver. Every finished
+date is checkpointed in etf_scrape_log with run_type 'backfill', so
+rerunning the same command after a crash resumes where it stopped. With
+coordination enabled every date is also claimed through an advisory
+lock, so several nodes can share one backfill.
+
+    python backfill.py 2023-01-01 2024-12-31 --etf 00919 --etf 00929 --workers 8
+"""
+
+import argparse
+import asyncio
+import time
+import logging
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from coordination import CLAIMED, Claim, Coordinator
+from models import ETFConfig, HoldingBatch
+from run_log import UnitTiming, write_log
+from scraper import ETFScraper
+from trading_calendar import DEFAULT_PATH, TradingCalendar, load_calendar
+
+logger = logging.getLogger(__name__)
+
+BACKFILL = 'backfill'
+
+@dataclass
+class Shard:
+    etf: ETFConfig
+    dates: List[date]
+
+class Backfill:
+    def __init__(self, scraper: ETFScraper, start: date, end: date,
+                 symbols: Optional[Sequence[str]] = None, shard_days: int = 20, workers: int = 4,
+                 calendar: Optional[TradingCalendar] = None, coordinator: Optional[Coordinator] = None):
+        self.scraper = scraper
+        self.coordinator = coordinator
+        self._claims: Dict[Tuple[str, date], Claim] = {}
+        self.calendar = calendar or load_calendar(scraper.config.get('calendar', {}).get('path', DEFAULT_PATH))
+        self.start = start
+        self.end = end
+        self.symbols = set(symbols) if symbols else None
+        self.shard_days = shard_days
+        self.workers = workers
+        self.saved = 0
+        self.failed = 0
+    
+    def etfs(self) -> List[ETFConfig]:
+        selected = []
+        for etf in self.scraper.etfs:
+            if self.symbols is not None and etf.symbol not in self.symbols:
+                continue
+            if not etf.history_url:
+                logger.warning(f"{etf.symbol}: no history_url configured, skipping")
+                continue
+            selected.append(etf)
+        return selected
+    
+    def completed(self, symbols: List[str]) -> Set[Tuple[str, date]]:
+        """(ETF, date) pairs a previous backfill already saved"""
+        conn = self.scraper._get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    SELECT DISTINCT etf_symbol, trade_date FROM etf_scrape_log
+                    WHERE run_type = %s AND status = 'success'
+                      AND etf_symbol = ANY(%s) AND trade_date BETWEEN %s AND %s
+                ''', (BACKFILL, symbols, self.start, self.end))
+                return set(cursor.fetchall())
+        finally:
+            conn.close()
+    
+    def plan(self) -> List[Shard]:
+        """Shards of up to shard_days pending dates per ETF, interleaved across ETFs"""
+        etfs = self.etfs()
+        days = self.calendar.sessions(self.start, self.end)
+        done = self.completed([e.symbol for e in etfs]) if etfs else set()
+        per_etf = []
+        for etf in etfs:
+            pending = [d for d in days if (etf.symbol, d) not in done]
+            per_etf.append([Shard(etf, pending[i:i + self.shard_days])
+                            for i in range(0, len(pending), self.shard_days)])
+            if len(pending) < len(days):
+                logger.info(f"{etf.symbol}: resuming, {len(days) - len(pending)} of {len(days)} days already done")
+        # Round-robin so concurrent workers spread over ETFs (and providers)
+        shards = []
+        for i in range(max((len(s) for s in per_etf), default=0)):
+            shards.extend(s[i] for s in per_etf if i < len(s))
+        return shards
+    
+    def _checkpoint(self, timings: List[UnitTiming]):
+        """Record finished dates, with their timings, in one INSERT"""
+        conn = self.scraper._get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                write_log(cursor, timings, BACKFILL)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _record(self, timings: List[UnitTiming]):
+        if self.coordinator is None:
+            self._checkpoint(timings)
+        else:
+            for t in timings:
+                self.coordinator.complete(self._claims.pop((t.etf_symbol, t.trade_date)), t.status, t.holdings_count,
+                                          timing=t)
+    
+    def _on_saved(self, batches: List[HoldingBatch]):
+        self._record([self.scraper.run_log.finish(b.source_url, 'success', etf_symbol=b.etf_symbol,
+                                                  trade_date=b.trade_date) for b in batches])
+        self.saved += len(batches)
+    
+    def _on_failed(self, timings: List[UnitTiming]):
+        self._record(timings)
+        self.failed += len(timings)
+    
+    def _failed(self, etf: ETFConfig, day: date, error: Optional[str] = None) -> UnitTiming:
+        page, _, _ = self.scraper.page_for(etf, day)
+        return self.scraper.run_log.finish(page.url, 'failed', error, etf.symbol, day)
+    
+    async def _worker(self, shards: asyncio.Queue, saves: asyncio.Queue, total: int):
+        while True:
+            try:
+                shard = shards.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            failed = []
+            for day in shard.dates:
+                if self.coordinator is not None:
+                    claim = await asyncio.to_thread(self.coordinator.claim, shard.etf.symbol, day)
+                    if claim.state != CLAIMED:
+                        continue  # done, or another node has it
+                    self._claims[(shard.etf.symbol, day)] = claim
+                try:
+                    holdings = await self.scraper.fetch_etf(shard.etf, day)
+                except Exception as e:
+                    logger.exception(f"{shard.etf.symbol}@{day}: backfill failed")
+                    failed.append(self._failed(shard.etf, day, str(e)[:500]))
+                    continue
+                if holdings is None:
+                    failed.append(self._failed(shard.etf, day))
+                elif holdings:
+                    await saves.put(holdings)
+                else:
+                    # Byte-identical to a page already ingested: nothing to save, but done
+                    await asyncio.to_thread(self._on_saved, [holdings])
+            if failed:
+                await asyncio.to_thread(self._on_failed, failed)
+            logger.info(f"Shard {shard.etf.symbol} {shard.dates[0]}..{shard.dates[-1]} done "
+                        f"({total - shards.qsize()}/{total} shards taken)")
+    
+    async def run(self):
+        shards = self.plan()
+        if not shards:
+            logger.info("Backfill: nothing to do")
+            return
+        logger.info(f"Backfill {self.start}..{self.end}: {sum(len(s.dates) for s in shards)} ETF-days "
+                    f"in {len(shards)} shards, {self.workers} workers")
+        started = time.perf_counter()
+        loop_mark = self.scraper.monitor_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        for shard in shards:
+            queue.put_nowait(shard)
+        saves = self.scraper.save_queue()
+        async with self.scraper:
+            saver = asyncio.create_task(self.scraper._save_worker(saves, on_saved=self._on_saved))
+            try:
+                await self.scraper.feed_saver(saver, asyncio.gather(*(self._worker(queue, saves, len(shards))
+                                                                      for _ in range(min(self.workers, len(shards))))))
+            finally:
+                try:
+                    await self.scraper.feed_saver(saver, saves.put(None))
+                    await saver
+                finally:
+                    for claim in self._claims.values():
+                        self.coordinator.release(claim)
+                    self._claims.clear()
+                if self.scraper.page_store is not None:
+                    await asyncio.to_thread(self.scraper.page_store.flush)
+                self.scraper.router.save()
+        logger.info(f"Backfill finished in {time.perf_counter() - started:.1f}s: "
+                    f"{self.saved} snapshots saved, {self.failed} days failed (retried on next run)")
+        self.scraper.loop_report(loop_mark)
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill historical ETF holdings")
+    parser.add_argument('start', type=date.fromisoformat, help="first trade date (YYYY-MM-DD)")
+    parser.add_argument('end', type=date.fromisoformat, help="last trade date (YYYY-MM-DD)")
+    parser.add_argument('--etf', action='append', dest='symbols', help="ETF symbol (repeatable; default all)")
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--shard-days', type=int, default=None, help="dates per shard")
+    parser.add_argument('--workers', type=int, default=None, help="concurrent shards")
+    args = parser.parse_args()
+    
+    scraper = ETFScraper(args.config)
+    backfill_config = scraper.config.get('backfill', {})
+    backfill = Backfill(
+        scraper, args.start, args.end, args.symbols,
+        shard_days=args.shard_days or backfill_config.get('shard_days', 20),
+        workers=args.workers or backfill_config.get('workers', 4),
+        coordinator=Coordinator.from_config(scraper.config, scraper._get_db_connection, 'backfill'),
+    )
+    asyncio.run(backfill.run())
+
+if __name__ == "__main__":
+    main()
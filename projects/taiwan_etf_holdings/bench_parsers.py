@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Offline parser benchmark
+Runs every registered parser over saved provider pages (debug_<provider>_<symbol>.html
+and the test fixtures) as raw bytes, the way the pipeline passes them, and compares
+rows extracted, peak memory and latency against a stored baseline. Latency is
+compared relative to the table parser on the same page in the same run, so the
+baseline holds across machines.
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+from parsers import DEFAULT_PARSER, PARSERS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = [os.path.join(HERE, 'debug_*.html'), os.path.join(HERE, 'tests', 'fixtures', '*.html')]
+DEFAULT_BASELINE = os.path.join(HERE, 'bench_baseline.json')
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def load_corpus(patterns: List[str]) -> Dict[str, bytes]:
+    pages = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, 'rb') as f:
+                pages[os.path.basename(path)] = f.read()
+    return pages
+
+def symbol_for(page_name: str) -> str:
+    # debug_<provider>_<symbol>.html or <provider>_<symbol>_<what>.html
+    parts = os.path.splitext(page_name)[0].split('_')
+    return next((p for p in parts if p[:1].isdigit()), parts[-1])
+
+def bench_one(parser, html: bytes, symbol: str, iterations: int) -> dict:
+    parser(html, symbol)  # warm-up: imports, regex compilation, lxml init
+    
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        rows = parser(html, symbol)
+        samples.append((time.perf_counter() - start) * 1000)
+    
+    tracemalloc.start()
+    parser(html, symbol)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    return {
+        'rows': len(rows),
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'max_ms': round(max(samples), 3),
+        'peak_kb': round(peak / 1024, 1),
+        'page_kb': round(len(html) / 1024, 1),
+    }
+
+def run(patterns: List[str], iterations: int) -> Dict[str, dict]:
+    results = {}
+    for page_name, html in load_corpus(patterns).items():
+        page = {provider: bench_one(parser, html, symbol_for(page_name), iterations)
+                for provider, parser in sorted(PARSERS.items())}
+        reference = page[DEFAULT_PARSER]['p50_ms']
+        for provider, result in page.items():
+            result['p50_vs_table'] = round(result['p50_ms'] / reference, 3) if reference else None
+            results[f"{page_name}:{provider}@v{PARSERS[provider].version}"] = result
+    return results
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Regressions: a different row count, more memory, or a p50 that grew
+    relative to the table parser's p50 on the same page in this run
+    """
+    problems = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if current['rows'] != base['rows']:
+            problems.append(f"{key}: rows {base['rows']} -> {current['rows']}")
+        ratio, base_ratio = current.get('p50_vs_table'), base.get('p50_vs_table')
+        if ratio and base_ratio and ratio > base_ratio * (1 + tolerance):
+            problems.append(f"{key}: p50 {base_ratio}x -> {ratio}x the table parser")
+        if current['peak_kb'] > base['peak_kb'] * (1 + tolerance):
+            problems.append(f"{key}: peak {base['peak_kb']}KB -> {current['peak_kb']}KB")
+    return problems
+
+def print_table(results: Dict[str, dict], baseline: Dict[str, dict]):
+    print(f"{'page:parser':<44} {'rows':>5} {'p50ms':>9} {'p95ms':>9} {'p99ms':>9} "
+          f"{'peakKB':>9} {'xtable':>7} {'vs base':>8}")
+    for key, r in results.items():
+        base = baseline.get(key)
+        ratio, base_ratio = r.get('p50_vs_table'), (base or {}).get('p50_vs_table')
+        delta = f"{(ratio / base_ratio - 1) * 100:+.0f}%" if ratio and base_ratio else 'new'
+        print(f"{key:<44} {r['rows']:>5} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+              f"{r['p99_ms']:>9.2f} {r['peak_kb']:>9.0f} {ratio or 0:>7.2f} {delta:>8}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--corpus', action='append', default=None,
+                    help='glob of saved pages (repeatable; default debug pages and test fixtures)')
+    ap.add_argument('--iterations', type=int, default=20)
+    ap.add_argument('--baseline', default=DEFAULT_BASELINE)
+    ap.add_argument('--tolerance', type=float, default=0.5,
+                    help='allowed fractional slowdown (relative to the table parser) / memory growth')
+    ap.add_argument('--update-baseline', action='store_true', help='write results as the new baseline')
+    args = ap.parse_args()
+    
+    corpus = args.corpus or DEFAULT_CORPUS
+    results = run(corpus, args.iterations)
+    if not results:
+        print(f"No pages match {', '.join(corpus)}")
+        return 1
+    
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+    
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+    
+    problems = compare(results, baseline, args.tolerance)
+    for p in problems:
+        print(f"REGRESSION {p}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Bulk loader for ETF holdings
+Streams rows into a staging table with COPY FROM STDIN, then merges set-based
+
+The merge is idempotent on the natural key (etf_symbol, trade_date, isin):
+rows that already exist with identical values are filtered out before any
+write, so re-running a day that has not changed touches neither heap nor
+indexes. Holdings without an ISIN fall back to matching on security_name.
+Only snapshots the merge actually modified get their holding changes
+recomputed.
+"""
+
+import io
+import time
+import logging
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, Iterable, Iterator, Tuple
+
+from changes import record_changes
+from models import HoldingBatch
+
+logger = logging.getLogger(__name__)
+
+HOLDING_COLUMNS = (
+    'etf_symbol', 'trade_date', 'holding_date', 'rank', 'isin',
+    'issuer_name', 'security_name', 'security_type',
+    'shares_held', 'market_value_twd', 'weight_pct', 'source_url',
+)
+
+KEY_COLUMNS = ('etf_symbol', 'trade_date', 'isin')
+VALUE_COLUMNS = tuple(c for c in HOLDING_COLUMNS if c not in KEY_COLUMNS)
+
+STAGE_TABLE = 'etf_holdings_stage'
+
+# Same holding in etf_holdings (h) and the deduplicated stage (s)
+_SAME_KEY = '''
+    h.etf_symbol = s.etf_symbol AND h.trade_date = s.trade_date
+    AND (h.isin = s.isin
+         OR (h.isin IS NULL AND s.isin IS NULL AND h.security_name = s.security_name))
+'''
+
+@dataclass
+class LoadStats:
+    copied: int = 0
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    changes: int = 0
+    seconds: float = 0.0
+    written: Dict[Tuple[str, date], int] = field(default_factory=dict)   # rows written per snapshot
+    
+    @property
+    def unchanged(self) -> int:
+        return max(self.copied - self.inserted - self.updated, 0)
+    
+    @property
+    def rows_per_sec(self) -> float:
+        return self.copied / self.seconds if self.seconds > 0 else 0.0
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+def copy_value(value) -> str:
+    """Format one value for COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.translate(_COPY_ESCAPES)
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+def batch_lines(batches: Iterable[HoldingBatch]) -> Iterator[str]:
+    """COPY text lines for every row, formatting each batch's per-page values once"""
+    for batch in batches:
+        prefix = f"{copy_value(batch.etf_symbol)}\t{copy_value(batch.trade_date)}\t{copy_value(batch.holding_date)}\t"
+        suffix = f"\t{copy_value(batch.source_url)}\n"
+        for row in batch.rows():
+            yield prefix + '\t'.join(map(copy_value, row)) + suffix
+
+class CopyStream(io.TextIOBase):
+    """File-like reader that renders rows lazily so COPY never needs the whole batch in memory"""
+    
+    def __init__(self, lines: Iterable[str]):
+        self._lines: Iterator[str] = iter(lines)
+        self._buffer = ''
+        self.rows = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def read(self, size: int = -1) -> str:
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        for line in self._lines:
+            chunks.append(line)
+            length += len(line)
+            self.rows += 1
+            if 0 <= size <= length:
+                break
+        data = ''.join(chunks)
+        if size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+def copy_to_stage(cursor, batches: Iterable[HoldingBatch]) -> int:
+    """Create the per-transaction staging table and COPY holdings into it"""
+    columns = ', '.join(HOLDING_COLUMNS)
+    cursor.execute(f'''
+        CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} ON COMMIT DROP AS
+        SELECT {columns} FROM etf_holdings WITH NO DATA
+    ''')
+    stream = CopyStream(batch_lines(batches))
+    cursor.copy_expert(f"COPY {STAGE_TABLE} ({columns}) FROM STDIN", stream)
+    return stream.rows
+
+def _tracked(cursor, dml: str, stats: LoadStats) -> int:
+    """Run a DML against etf_holdings (aliased h), remembering which snapshots it touched and how much"""
+    cursor.execute(f'''
+        WITH modified AS ({dml} RETURNING h.etf_symbol, h.trade_date),
+        touched AS (
+            INSERT INTO {STAGE_TABLE}_touched
+            SELECT DISTINCT etf_symbol, trade_date FROM modified
+        )
+        SELECT etf_symbol, trade_date, COUNT(*) FROM modified GROUP BY etf_symbol, trade_date
+    ''')
+    total = 0
+    for symbol, trade_date, count in cursor.fetchall():
+        stats.written[(symbol, trade_date)] = stats.written.get((symbol, trade_date), 0) + count
+        total += count
+    return total
+
+def merge_stage(cursor, stats: LoadStats, diff: bool = True) -> LoadStats:
+    """Upsert staged snapshots into etf_holdings, writing only rows that differ; diff=False leaves changes to the caller"""
+    columns = ', '.join(HOLDING_COLUMNS)
+    values_h = ', '.join(f'h.{c}' for c in VALUE_COLUMNS)
+    values_s = ', '.join(f's.{c}' for c in VALUE_COLUMNS)
+    assignments = ', '.join(f'{c} = s.{c}' for c in VALUE_COLUMNS)
+    
+    # Collapse duplicate keys within the batch (first rank wins)
+    cursor.execute(f'''
+        CREATE TEMP TABLE {STAGE_TABLE}_dedup ON COMMIT DROP AS
+        SELECT DISTINCT ON (etf_symbol, trade_date, isin,
+                            CASE WHEN isin IS NULL THEN security_name END)
+               {columns}
+        FROM {STAGE_TABLE}
+        ORDER BY etf_symbol, trade_date, isin,
+                 CASE WHEN isin IS NULL THEN security_name END, rank
+    ''')
+    cursor.execute(f'''
+        CREATE TEMP TABLE {STAGE_TABLE}_touched ON COMMIT DROP AS
+        SELECT etf_symbol, trade_date FROM {STAGE_TABLE} WITH NO DATA
+    ''')
+    
+    # Holdings that dropped out of a re-scraped (etf_symbol, trade_date) snapshot
+    stats.deleted = _tracked(cursor, f'''
+        DELETE FROM etf_holdings h
+        USING (SELECT DISTINCT etf_symbol, trade_date FROM {STAGE_TABLE}_dedup) snap
+        WHERE h.etf_symbol = snap.etf_symbol AND h.trade_date = snap.trade_date
+          AND NOT EXISTS (SELECT 1 FROM {STAGE_TABLE}_dedup s WHERE {_SAME_KEY})
+    ''', stats)
+    
+    stats.updated = _tracked(cursor, f'''
+        UPDATE etf_holdings h
+        SET {assignments}, scraped_at = NOW()
+        FROM {STAGE_TABLE}_dedup s
+        WHERE {_SAME_KEY}
+          AND ({values_h}) IS DISTINCT FROM ({values_s})
+    ''', stats)
+    
+    stats.inserted = _tracked(cursor, f'''
+        INSERT INTO etf_holdings AS h ({columns})
+        SELECT {columns} FROM {STAGE_TABLE}_dedup s
+        WHERE NOT EXISTS (SELECT 1 FROM etf_holdings h WHERE {_SAME_KEY})
+        ON CONFLICT (etf_symbol, trade_date, isin) DO NOTHING
+    ''', stats)
+    
+    if diff:
+        stats.changes = record_changes(cursor, f'{STAGE_TABLE}_touched')
+    return stats
+
+def bulk_load_holdings(conn, batches: Iterable[HoldingBatch], diff: bool = True) -> LoadStats:
+    """COPY + merge (+ change detection unless diff=False) in one transaction"""
+    start = time.perf_counter()
+    stats = LoadStats()
+    with conn.cursor() as cursor:
+        stats.copied = copy_to_stage(cursor, batches)
+        merge_stage(cursor, stats, diff)
+    conn.commit()
+    stats.seconds = time.perf_counter() - start
+    return stats
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Holding change detection
+Diffs each ingested snapshot against the previous trade_date in one SQL statement
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Join key for a holding across two snapshots (ISIN, else the security name)
+_MATCH_KEY = "COALESCE(isin, 'name:' || security_name)"
+
+def record_changes(cursor, snapshots_table: str) -> int:
+    """
+    Rebuild etf_holding_changes for the (etf_symbol, trade_date) pairs in
+    snapshots_table, plus the next snapshot of each ETF since its baseline
+    moved too. Runs inside the caller's transaction.
+    """
+    cursor.execute(f'''
+        CREATE TEMP TABLE IF NOT EXISTS diff_targets ON COMMIT DROP AS
+        SELECT t.etf_symbol, t.trade_date, NULL::date AS previous_trade_date
+        FROM {snapshots_table} t WITH NO DATA
+    ''')
+    cursor.execute(f'''
+        INSERT INTO diff_targets (etf_symbol, trade_date, previous_trade_date)
+        SELECT k.etf_symbol, k.trade_date,
+               (SELECT MAX(h.trade_date) FROM etf_holdings h
+                WHERE h.etf_symbol = k.etf_symbol AND h.trade_date < k.trade_date)
+        FROM (
+            SELECT etf_symbol, trade_date FROM {snapshots_table}
+            UNION
+            SELECT t.etf_symbol,
+                   (SELECT MIN(h.trade_date) FROM etf_holdings h
+                    WHERE h.etf_symbol = t.etf_symbol AND h.trade_date > t.trade_date)
+            FROM {snapshots_table} t
+        ) k
+        WHERE k.trade_date IS NOT NULL
+    ''')
+    cursor.execute('''
+        DELETE FROM etf_holding_changes c
+        USING diff_targets d
+        WHERE c.etf_symbol = d.etf_symbol AND c.trade_date = d.trade_date
+    ''')
+    cursor.execute(f'''
+        WITH cur AS (
+            SELECT d.etf_symbol, d.trade_date, d.previous_trade_date, h.isin,
+                   h.security_name, h.weight_pct, h.shares_held, {_MATCH_KEY} AS match_key
+            FROM diff_targets d
+            JOIN etf_holdings h ON h.etf_symbol = d.etf_symbol AND h.trade_date = d.trade_date
+            WHERE d.previous_trade_date IS NOT NULL
+        ),
+        prev AS (
+            SELECT d.etf_symbol, d.trade_date, d.previous_trade_date, h.isin,
+                   h.security_name, h.weight_pct, h.shares_held, {_MATCH_KEY} AS match_key
+            FROM diff_targets d
+            JOIN etf_holdings h ON h.etf_symbol = d.etf_symbol
+                               AND h.trade_date = d.previous_trade_date
+        )
+        INSERT INTO etf_holding_changes
+            (etf_symbol, trade_date, previous_trade_date, isin, security_name,
+             previous_weight, current_weight, weight_change,
+             previous_shares, current_shares, shares_change, change_type)
+        SELECT
+            COALESCE(c.etf_symbol, p.etf_symbol),
+            COALESCE(c.trade_date, p.trade_date),
+            COALESCE(c.previous_trade_date, p.previous_trade_date),
+            COALESCE(c.isin, p.isin),
+            COALESCE(c.security_name, p.security_name),
+            p.weight_pct,
+            c.weight_pct,
+            COALESCE(c.weight_pct, 0) - COALESCE(p.weight_pct, 0),
+            p.shares_held,
+            c.shares_held,
+            COALESCE(c.shares_held, 0) - COALESCE(p.shares_held, 0),
+            CASE
+                WHEN p.match_key IS NULL THEN 'added'
+                WHEN c.match_key IS NULL THEN 'removed'
+                WHEN c.shares_held > p.shares_held THEN 'increased'
+                WHEN c.shares_held < p.shares_held THEN 'decreased'
+                ELSE 'reweighted'
+            END
+        FROM cur c
+        FULL OUTER JOIN prev p
+            ON c.etf_symbol = p.etf_symbol AND c.trade_date = p.trade_date
+           AND c.match_key = p.match_key
+        WHERE p.match_key IS NULL
+           OR c.match_key IS NULL
+           OR c.shares_held IS DISTINCT FROM p.shares_held
+           OR c.weight_pct IS DISTINCT FROM p.weight_pct
+    ''')
+    return cursor.rowcount
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Multi-node work distribution through Postgres advisory locks
+Every (run type, ETF, trade date) unit maps to one advisory lock. A node
+claims a unit by taking that lock on a connection it keeps for the
+unit's lifetime, so a crashed node's claims vanish with its connection
+and another node picks the unit up. Finished units are recorded in
+etf_scrape_log; a unit logged as success is never claimed again.
+"""
+
+import hashlib
+import os
+import socket
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Callable, Optional
+
+from run_log import UnitTiming, write_log
+
+logger = logging.getLogger(__name__)
+
+CLAIMED = 'claimed'
+BUSY = 'busy'        # another node holds the lock
+DONE = 'done'        # already logged as success
+
+def unit_key(run_type: str, etf_symbol: str, trade_date: date) -> int:
+    """Stable signed 64-bit advisory lock key for a unit"""
+    digest = hashlib.blake2b(f'{run_type}:{etf_symbol}:{trade_date.isoformat()}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+@dataclass
+class Claim:
+    etf_symbol: str
+    trade_date: date
+    state: str
+    conn: Any = None
+    started: datetime = field(default_factory=datetime.now)
+
+class Coordinator:
+    def __init__(self, connect: Callable[[], Any], run_type: str = 'daily', node_id: Optional[str] = None):
+        self.connect = connect
+        self.run_type = run_type
+        self.node_id = node_id or f'{socket.gethostname()}:{os.getpid()}'
+    
+    @classmethod
+    def from_config(cls, config: dict, connect: Callable[[], Any], run_type: str = 'daily') -> Optional['Coordinator']:
+        """Coordinator when coordination.enabled is set, else None (single-node mode)"""
+        coordination = config.get('coordination', {})
+        if not coordination.get('enabled', False):
+            return None
+        return cls(connect, run_type, coordination.get('node_id'))
+    
+    def claim(self, etf_symbol: str, trade_date: date) -> Claim:
+        """Try to take a unit; blocking (run it in a thread from async code)"""
+        conn = self.connect()
+        conn.autocommit = True
+        key = unit_key(self.run_type, etf_symbol, trade_date)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_lock(%s)', (key,))
+                if not cursor.fetchone()[0]:
+                    conn.close()
+                    return Claim(etf_symbol, trade_date, BUSY)
+                # Checked under the lock, so a unit finishing elsewhere cannot slip in between
+                cursor.execute('''
+                    SELECT 1 FROM etf_scrape_log
+                    WHERE etf_symbol = %s AND trade_date = %s AND run_type = %s AND status = 'success'
+                    LIMIT 1
+                ''', (etf_symbol, trade_date, self.run_type))
+                if cursor.fetchone() is not None:
+                    conn.close()
+                    return Claim(etf_symbol, trade_date, DONE)
+        except Exception:
+            conn.close()
+            raise
+        return Claim(etf_symbol, trade_date, CLAIMED, conn)
+    
+    def complete(self, claim: Claim, status: str, holdings_count: int = 0, error: Optional[str] = None,
+                 timing: Optional[UnitTiming] = None):
+        """Log the unit's outcome (with its timings, if the caller kept them) and release it"""
+        if claim.conn is None:
+            return
+        if timing is None:
+            timing = UnitTiming(claim.etf_symbol, claim.trade_date, claim.started)
+        timing.finish(status, error or timing.error)
+        timing.holdings_count = holdings_count or timing.holdings_count
+        try:
+            with claim.conn.cursor() as cursor:
+                write_log(cursor, [timing], self.run_type, self.node_id)
+        finally:
+            self.release(claim)
+    
+    def release(self, claim: Claim):
+        """Drop a claim without logging; closing the session frees its advisory lock"""
+        if claim.conn is not None:
+            claim.conn.close()
+            claim.conn = None
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Bounded-concurrency fetch scheduler
+Global concurrency cap, per-provider token buckets and priorities
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursting up to `burst`"""
+    
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        """Wait until a token is available and take it (FIFO among waiters)"""
+        if not self.rate:
+            return
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+class PrioritySemaphore:
+    """Semaphore that wakes the highest-priority waiter first"""
+    
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+    
+    async def acquire(self, priority: int = 0):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        # heapq is a min-heap, so negate: higher priority pops first
+        heapq.heappush(self._waiters, (-priority, next(self._counter), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+    
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+    
+    def release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._value += 1
+
+class FetchScheduler:
+    """Runs fetch coroutines under a global cap and per-provider rate limits"""
+    
+    def __init__(self, max_concurrency: int = 8,
+                 provider_limits: Optional[Dict[str, dict]] = None,
+                 default_rate: float = 0, default_burst: float = 1):
+        self.max_concurrency = max_concurrency
+        self.provider_limits = provider_limits or {}
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self._slots = PrioritySemaphore(max_concurrency)
+        self._buckets: Dict[str, TokenBucket] = {}
+    
+    @classmethod
+    def from_config(cls, config: dict) -> 'FetchScheduler':
+        scraping = config.get('scraping', {})
+        return cls(
+            max_concurrency=scraping.get('max_concurrency', 8),
+            provider_limits=scraping.get('providers', {}),
+            default_rate=scraping.get('default_rate', 0),
+            default_burst=scraping.get('default_burst', 1),
+        )
+    
+    @property
+    def waiting(self) -> int:
+        """Fetches holding a rate token and queued for a slot"""
+        return self._slots.waiting
+    
+    @property
+    def in_flight(self) -> int:
+        return self.max_concurrency - self._slots._value
+    
+    def bucket(self, provider: str) -> TokenBucket:
+        if provider not in self._buckets:
+            limits = self.provider_limits.get(provider) or {}
+            self._buckets[provider] = TokenBucket(
+                limits.get('rate', self.default_rate),
+                limits.get('burst', self.default_burst),
+            )
+        return self._buckets[provider]
+    
+    async def submit(self, provider: str, priority: int,
+                     fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Run fn(*args) once the provider's bucket and a global slot allow it"""
+        # Take the rate token first so a throttled provider never sits on a slot
+        await self.bucket(provider).acquire()
+        await self._slots.acquire(priority)
+        try:
+            return await fn(*args)
+        finally:
+            self._slots.release()
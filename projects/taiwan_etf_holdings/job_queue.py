@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Durable scrape pipeline backed by the etf_scrape_jobs table
+Each (ETF, trade date) unit moves fetch -> parse -> save -> diff -> done.
+Workers claim one unit at a time with FOR UPDATE SKIP LOCKED, run its
+current stage and hand it on, recording the milliseconds each stage took.
+Stage outputs live in Postgres (raw page in etf_scrape_pages, parsed
+holdings on the job row), so any node can run any stage and a restart
+only redoes the stage that was in flight. Workers renew the leases of
+the claims they are working; a claim whose worker vanished is taken over
+once its lease expires, and the old worker can no longer record a result.
+
+    python job_queue.py enqueue [--date YYYY-MM-DD] [--run-type backfill] [--etf 00919 ...]
+    python job_queue.py work [--stages parse,save] [--concurrency 4] [--forever]
+    python job_queue.py status
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+import zlib
+import logging
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+from changes import record_changes
+from metrics import QUEUE_DEPTH, UNITS
+from bulk_load import bulk_load_holdings
+from parse_cache import decode_holdings, encode_holdings
+from resilience import FetchError, call_with_retries
+from scraper import ETFScraper
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('fetch', 'parse', 'save', 'diff')
+DONE = 'done'
+FAILED = 'failed'
+
+# Columns a stage may hand on to the next one
+_OUTPUT_COLUMNS = ('route', 'page_sha256', 'holdings', 'holdings_count')
+
+@dataclass
+class Job:
+    id: int
+    etf_symbol: str
+    trade_date: date
+    run_type: str       # 'daily' fetches the live page, 'backfill' the ETF's history_url
+    stage: str
+    route: Optional[str]
+    attempts: int
+    page_sha256: Optional[str]
+    holdings: Optional[bytes]
+    stage_ms: Dict[str, float] = field(default_factory=dict)
+    token: str = ''     # locked_by of this claim; results are only recorded while it still holds
+
+class JobQueue:
+    """SQL side of the queue; every method blocks and runs on the caller's connection"""
+    
+    def __init__(self, node_id: Optional[str] = None, max_attempts: int = 3,
+                 lease_seconds: int = 600, retry_delay: int = 60):
+        self.node_id = node_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+    
+    @classmethod
+    def from_config(cls, config: dict) -> 'JobQueue':
+        queue = config.get('job_queue', {})
+        return cls(
+            config.get('coordination', {}).get('node_id'),
+            queue.get('max_attempts', 3),
+            queue.get('lease_seconds', 600),
+            queue.get('retry_delay', 60),
+        )
+    
+    def enqueue(self, conn, units: Iterable[Tuple[str, date]], run_type: str = 'daily') -> int:
+        """
+        Add units at the fetch stage; failed units are reset, live or done ones left alone.
+        run_type is stored with the unit, so a daily unit retried after midnight still
+        fetches the live page and is logged as daily.
+        """
+        with conn.cursor() as cursor:
+            count = 0
+            for symbol, trade_date in units:
+                cursor.execute('''
+                    INSERT INTO etf_scrape_jobs (etf_symbol, trade_date, run_type) VALUES (%s, %s, %s)
+                    ON CONFLICT (etf_symbol, trade_date) DO UPDATE
+                    SET stage = 'fetch', status = 'ready', route = NULL, attempts = 0, run_type = EXCLUDED.run_type,
+                        run_after = NOW(), error_message = NULL, stage_ms = '{}', updated_at = NOW()
+                    WHERE etf_scrape_jobs.stage = 'failed'
+                ''', (symbol, trade_date, run_type))
+                count += cursor.rowcount
+        conn.commit()
+        return count
+    
+    def claim(self, conn, stages: Sequence[str]) -> Optional[Job]:
+        """
+        Take the next runnable unit in one of stages (or one whose lease expired).
+        Each claim gets its own token in locked_by, so a worker whose unit was taken
+        over cannot record its stale result over the new owner's.
+        """
+        token = f'{self.node_id}/{uuid.uuid4().hex[:12]}'
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                UPDATE etf_scrape_jobs j
+                SET status = 'running', locked_by = %s, locked_at = NOW(),
+                    attempts = attempts + 1, updated_at = NOW()
+                WHERE id = (
+                    SELECT id FROM etf_scrape_jobs
+                    WHERE stage = ANY(%s) AND run_after <= NOW()
+                      AND (status = 'ready'
+                           OR (status = 'running' AND locked_at < NOW() - make_interval(secs => %s)))
+                    ORDER BY run_after, id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, etf_symbol, trade_date, run_type, stage, route, attempts, page_sha256, holdings, stage_ms
+            ''', (token, list(stages), self.lease_seconds))
+            row = cursor.fetchone()
+        conn.commit()
+        if row is None:
+            return None
+        *head, holdings, stage_ms = row
+        return Job(*head, bytes(holdings) if holdings is not None else None, stage_ms or {}, token)
+    
+    def heartbeat(self, conn, tokens: Sequence[str]) -> int:
+        """Renew the lease of claims still held under tokens"""
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                UPDATE etf_scrape_jobs SET locked_at = NOW()
+                WHERE locked_by = ANY(%s) AND status = 'running'
+            ''', (list(tokens),))
+            renewed = cursor.rowcount
+        conn.commit()
+        return renewed
+    
+    def _lost(self, conn, job: Job) -> bool:
+        """Roll back when the last UPDATE matched nothing: the claim was taken over"""
+        conn.rollback()
+        logger.warning(f"{job.etf_symbol}@{job.trade_date} {job.stage}: claim was taken over, result discarded")
+        return False
+    
+    def _log(self, cursor, job: Job, status: str, holdings_count: Optional[int], error: Optional[str]):
+        cursor.execute('''
+            INSERT INTO etf_scrape_log
+                (etf_symbol, trade_date, run_type, node_id, scrape_date, scrape_start,
+                 scrape_end, status, error_message, pages_scraped, holdings_count,
+                 route, fetch_ms, parse_ms, db_ms)
+            SELECT etf_symbol, trade_date, run_type, %s, CURRENT_DATE, created_at, NOW(), %s, %s, 1,
+                   COALESCE(%s, holdings_count, 0), route,
+                   (stage_ms->>'fetch')::real, (stage_ms->>'parse')::real,
+                   COALESCE((stage_ms->>'save')::real, 0) + COALESCE((stage_ms->>'diff')::real, 0)
+            FROM etf_scrape_jobs WHERE id = %s
+        ''', (self.node_id, status, error, holdings_count, job.id))
+    
+    def _drop_page(self, cursor, sha: Optional[str]):
+        """Delete a handed-off page once no unfinished unit still needs it"""
+        if sha:
+            cursor.execute('''
+                DELETE FROM etf_scrape_pages p WHERE sha256 = %s
+                AND NOT EXISTS (SELECT 1 FROM etf_scrape_jobs
+                                WHERE page_sha256 = p.sha256 AND stage IN ('fetch', 'parse'))
+            ''', (sha,))
+    
+    def advance(self, conn, job: Job, next_stage: str, ms: float, **outputs) -> bool:
+        """Record the finished stage's time and outputs and make the unit ready for next_stage"""
+        columns = [c for c in _OUTPUT_COLUMNS if c in outputs]
+        assignments = ''.join(f', {c} = %s' for c in columns)
+        done = next_stage == DONE
+        with conn.cursor() as cursor:
+            cursor.execute(f'''
+                UPDATE etf_scrape_jobs
+                SET stage = %s, status = 'ready', attempts = 0, run_after = NOW(),
+                    locked_by = NULL, locked_at = NULL, error_message = NULL, updated_at = NOW(),
+                    stage_ms = jsonb_set(stage_ms, ARRAY[%s],
+                                         to_jsonb(COALESCE((stage_ms->>%s)::numeric, 0) + %s))
+                    {assignments}
+                    {', holdings = NULL' if done else ''}
+                WHERE id = %s AND locked_by = %s
+            ''', (next_stage, job.stage, job.stage, round(ms, 1), *(outputs[c] for c in columns), job.id, job.token))
+            if cursor.rowcount == 0:
+                return self._lost(conn, job)
+            if done:
+                self._log(cursor, job, 'success', outputs.get('holdings_count'), None)
+            if done or outputs.get('page_sha256', job.page_sha256) != job.page_sha256:
+                # Finished, or the page was replaced (a parse rewinding to fetch)
+                self._drop_page(cursor, job.page_sha256)
+        conn.commit()
+        if done:
+            UNITS.inc(status='success')
+        return True
+    
+    def fail(self, conn, job: Job, ms: float, error: str, retryable: bool = True) -> bool:
+        """Retry the stage after a delay (growing per attempt), or fail the unit for good"""
+        final = not retryable or job.attempts >= self.max_attempts
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                UPDATE etf_scrape_jobs
+                SET stage = CASE WHEN %s THEN 'failed' ELSE stage END,
+                    status = 'ready', locked_by = NULL, locked_at = NULL, error_message = %s,
+                    run_after = NOW() + make_interval(secs => %s), updated_at = NOW(),
+                    stage_ms = jsonb_set(stage_ms, ARRAY[%s],
+                                         to_jsonb(COALESCE((stage_ms->>%s)::numeric, 0) + %s))
+                WHERE id = %s AND locked_by = %s
+            ''', (final, error[:1000], self.retry_delay * job.attempts,
+                  job.stage, job.stage, round(ms, 1), job.id, job.token))
+            if cursor.rowcount == 0:
+                return self._lost(conn, job)
+            if final:
+                self._log(cursor, job, 'failed', 0, f'{job.stage}: {error}'[:1000])
+                self._drop_page(cursor, job.page_sha256)
+        conn.commit()
+        if final:
+            UNITS.inc(status='failed')
+        logger.warning(f"{job.etf_symbol}@{job.trade_date} {job.stage} "
+                       f"{'failed for good' if final else 'will be retried'}: {error}")
+        return True
+    
+    def store_page(self, conn, sha: str, body: bytes):
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO etf_scrape_pages (sha256, body) VALUES (%s, %s)
+                ON CONFLICT (sha256) DO NOTHING
+            ''', (sha, zlib.compress(body, 6)))
+        conn.commit()
+    
+    def load_page(self, conn, sha: str) -> bytes:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT body FROM etf_scrape_pages WHERE sha256 = %s', (sha,))
+            row = cursor.fetchone()
+        conn.commit()
+        if row is None:
+            raise LookupError(f"page {sha[:12]} is no longer stored")
+        return zlib.decompress(row[0])
+    
+    def pending(self, conn) -> int:
+        """Units not yet done or failed"""
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM etf_scrape_jobs WHERE stage NOT IN ('done', 'failed')")
+            count = cursor.fetchone()[0]
+        conn.commit()
+        return count
+    
+    def status(self, conn) -> List[Tuple]:
+        """(trade_date, stage, units, avg ms per stage) for recent dates"""
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                WITH timings AS (
+                    SELECT trade_date, stage, key, ROUND(AVG(value::numeric), 1) AS avg_ms
+                    FROM etf_scrape_jobs, jsonb_each_text(stage_ms)
+                    WHERE trade_date >= CURRENT_DATE - 7
+                    GROUP BY trade_date, stage, key
+                )
+                SELECT j.trade_date, j.stage, COUNT(*),
+                       (SELECT jsonb_object_agg(t.key, t.avg_ms) FROM timings t
+                        WHERE t.trade_date = j.trade_date AND t.stage = j.stage)
+                FROM etf_scrape_jobs j
+                WHERE j.trade_date >= CURRENT_DATE - 7
+                GROUP BY j.trade_date, j.stage
+                ORDER BY j.trade_date DESC, j.stage
+            ''')
+            rows = cursor.fetchall()
+        conn.commit()
+        return rows
+
+class QueueWorker:
+    """Runs queue stages with the scraper's session, process pool, router and rate limits"""
+    
+    def __init__(self, scraper: ETFScraper, queue: JobQueue,
+                 stages: Sequence[str] = STAGES, concurrency: int = 4):
+        self.scraper = scraper
+        self.queue = queue
+        self.stages = list(stages)
+        self.concurrency = concurrency
+        self.etfs = {etf.symbol: etf for etf in scraper.etfs}
+        self._depth_checked = 0.0
+        self._held: Set[str] = set()   # tokens of claims being worked, renewed by _heartbeat
+    
+    def _page(self, job: Job):
+        etf = self.etfs[job.etf_symbol]
+        page, route_key, label = self.scraper.page_for(etf, job.trade_date if job.run_type == 'backfill' else None)
+        return etf, page, route_key
+    
+    def _routes(self, etf, route_key: str, job: Job) -> List[str]:
+        routes = self.scraper.router.plan(etf.provider, route_key, self.scraper.available_routes())
+        if job.route in routes:
+            routes = routes[routes.index(job.route):]
+        return routes
+    
+    async def _fetch(self, conn, job: Job) -> Tuple[str, Dict[str, Any]]:
+        etf, page, route_key = self._page(job)
+        scraper = self.scraper
+        routes = self._routes(etf, route_key, job)
+        for i, route in enumerate(routes):
+            try:
+                body = await call_with_retries(
+                    scraper.fetch_scheduler.submit, etf.provider, etf.priority, scraper.fetch_page, page, route,
+                    policy=scraper.retry_policy, breakers=scraper.breakers,
+                    keys=(f"{route}:etf:{etf.symbol}",), host_keys=(f"{route}:host:{urlsplit(page.url).hostname}",),
+                    label=f"{job.etf_symbol}@{job.trade_date} ({route})",
+                )
+            except FetchError:
+                scraper.router.record(etf.provider, route_key, route, False, scraper._fetch_ms.get(page.url, 0.0))
+                if i == len(routes) - 1:
+                    raise
+                continue
+            if body is None:
+                # Identical to a page already ingested: nothing left to do
+                scraper.router.record(etf.provider, route_key, route, True, scraper._fetch_ms.get(page.url, 0.0))
+                return DONE, {'holdings_count': 0}
+            sha = scraper._page_hashes.pop(page.url, None) or hashlib.sha256(body).hexdigest()
+            await asyncio.to_thread(self.queue.store_page, conn, sha, bytes(body))
+            return 'parse', {'route': route, 'page_sha256': sha}
+        raise FetchError("no fetch route available", retryable=False)
+    
+    async def _parse(self, conn, job: Job) -> Tuple[str, Dict[str, Any]]:
+        etf, page, route_key = self._page(job)
+        body = await asyncio.to_thread(self.queue.load_page, conn, job.page_sha256)
+        self.scraper._page_hashes[page.url] = job.page_sha256
+        try:
+            holdings = await self.scraper.parse_page(body, page, job.trade_date)
+        finally:
+            self.scraper._page_hashes.pop(page.url, None)
+        route = job.route or self._routes(etf, route_key, job)[0]
+        # The fetch was timed in an earlier stage (maybe on another node): outcome only
+        self.scraper.router.record(etf.provider, route_key, route, bool(holdings), None)
+        if holdings:
+            return 'save', {'holdings': encode_holdings(holdings), 'holdings_count': len(holdings)}
+        routes = self._routes(etf, route_key, job)
+        if route in routes and routes.index(route) + 1 < len(routes):
+            # Route gave an unparseable page: fetch again through the next one
+            return 'fetch', {'route': routes[routes.index(route) + 1], 'page_sha256': None}
+        raise ValueError("no holdings in page")
+    
+    async def _save(self, conn, job: Job) -> Tuple[str, Dict[str, Any]]:
+        batch = decode_holdings(job.holdings)
+        stats = await asyncio.to_thread(bulk_load_holdings, conn, [batch], False)
+        if self.scraper.page_store is not None and job.page_sha256:
+            self.scraper.page_store.mark_ingested(batch.source_url, job.page_sha256)
+        modified = stats.inserted + stats.updated + stats.deleted
+        return ('diff' if modified else DONE), {'holdings_count': len(batch)}
+    
+    def _record_changes(self, conn, job: Job) -> int:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                CREATE TEMP TABLE etf_scrape_job_unit ON COMMIT DROP AS
+                SELECT %s::varchar(10) AS etf_symbol, %s::date AS trade_date
+            ''', (job.etf_symbol, job.trade_date))
+            changes = record_changes(cursor, 'etf_scrape_job_unit')
+        conn.commit()
+        return changes
+    
+    async def _diff(self, conn, job: Job) -> Tuple[str, Dict[str, Any]]:
+        await asyncio.to_thread(self._record_changes, conn, job)
+        return DONE, {}
+    
+    async def _worker(self, until_idle: bool, poll_interval: float):
+        conn = await asyncio.to_thread(self.scraper._get_db_connection)
+        try:
+            while True:
+                job = await asyncio.to_thread(self.queue.claim, conn, self.stages)
+                if job is None or time.monotonic() - self._depth_checked > 15:
+                    self._depth_checked = time.monotonic()
+                    pending = await asyncio.to_thread(self.queue.pending, conn)
+                    QUEUE_DEPTH.set(pending, queue='jobs')
+                if job is None:
+                    if until_idle and pending == 0:
+                        return
+                    await asyncio.sleep(poll_interval)
+                    continue
+                started = time.perf_counter()
+                self._held.add(job.token)
+                try:
+                    next_stage, outputs = await getattr(self, f'_{job.stage}')(conn, job)
+                except Exception as e:
+                    conn.rollback()
+                    # Fetch errors get the queue's own, slower retries even when not retryable in place
+                    retryable = not isinstance(e, (ValueError, KeyError))
+                    await asyncio.to_thread(self.queue.fail, conn, job,
+                                            (time.perf_counter() - started) * 1000, str(e), retryable)
+                    continue
+                finally:
+                    self._held.discard(job.token)
+                ms = (time.perf_counter() - started) * 1000
+                if await asyncio.to_thread(self.queue.advance, conn, job, next_stage, ms, **outputs):
+                    logger.info(f"{job.etf_symbol}@{job.trade_date}: {job.stage} {ms:.0f} ms -> {next_stage}")
+        finally:
+            conn.close()
+    
+    async def _heartbeat(self):
+        """Renew held claims every third of the lease, so a slow fetch is not taken over mid-stage"""
+        conn = None
+        try:
+            while True:
+                await asyncio.sleep(self.queue.lease_seconds / 3)
+                if not self._held:
+                    continue
+                try:
+                    if conn is None:
+                        conn = await asyncio.to_thread(self.scraper._get_db_connection)
+                    await asyncio.to_thread(self.queue.heartbeat, conn, list(self._held))
+                except Exception as e:
+                    logger.warning(f"Job queue heartbeat failed: {e}")
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+        finally:
+            if conn is not None:
+                conn.close()
+    
+    async def run(self, until_idle: bool = True, poll_interval: float = 5.0):
+        """Work the queue; with until_idle, return once no unit is left unfinished"""
+        loop_mark = self.scraper.monitor_loop()
+        async with (self.scraper if self.scraper.session is None else contextlib.nullcontext(self.scraper)):
+            heartbeat = asyncio.create_task(self._heartbeat())
+            try:
+                await asyncio.gather(*(self._worker(until_idle, poll_interval)
+                                       for _ in range(self.concurrency)))
+            finally:
+                heartbeat.cancel()
+                if self.scraper.page_store is not None:
+                    await asyncio.to_thread(self.scraper.page_store.flush)
+                self.scraper.router.save()
+        self.scraper.loop_report(loop_mark)
+
+def main():
+    parser = argparse.ArgumentParser(description="Durable ETF scrape job queue")
+    parser.add_argument('--config', default='config.yaml')
+    commands = parser.add_subparsers(dest='command', required=True)
+    enqueue = commands.add_parser('enqueue', help="queue (ETF, trade date) units")
+    enqueue.add_argument('--date', type=date.fromisoformat, default=None, help="trade date (default today)")
+    enqueue.add_argument('--run-type', choices=('daily', 'backfill'), default=None,
+                         help="live page or history_url (default daily for today, backfill otherwise)")
+    enqueue.add_argument('--etf', action='append', dest='symbols', help="ETF symbol (repeatable; default all)")
+    work = commands.add_parser('work', help="run queue workers")
+    work.add_argument('--stages', default=','.join(STAGES), help="comma-separated stages to run")
+    work.add_argument('--concurrency', type=int, default=None)
+    work.add_argument('--forever', action='store_true', help="keep polling instead of exiting when idle")
+    commands.add_parser('status', help="units per date and stage, with average stage times")
+    args = parser.parse_args()
+    
+    scraper = ETFScraper(args.config)
+    queue = JobQueue.from_config(scraper.config)
+    if args.command == 'work':
+        stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+        concurrency = args.concurrency or scraper.config.get('job_queue', {}).get('concurrency', 4)
+        asyncio.run(QueueWorker(scraper, queue, stages, concurrency).run(until_idle=not args.forever))
+        return
+    
+    conn = scraper._get_db_connection()
+    try:
+        if args.command == 'enqueue':
+            trade_date = args.date or date.today()
+            run_type = args.run_type or ('daily' if trade_date == date.today() else 'backfill')
+            symbols = args.symbols or [etf.symbol for etf in scraper.etfs]
+            added = queue.enqueue(conn, [(symbol, trade_date) for symbol in symbols], run_type)
+            print(f"Queued {added} of {len(symbols)} {run_type} units for {trade_date}")
+        else:
+            for trade_date, stage, units, avg_ms in queue.status(conn):
+                print(f"{trade_date}  {stage:<7} {units:>5}  {json.dumps(avg_ms or {})}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
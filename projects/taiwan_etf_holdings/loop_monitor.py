@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Event-loop lag and blocking-call detector
+Optional instrumentation (loop_monitor.enabled in config.yaml). Every
+callback the loop runs is timed, and a watchdog thread snapshots the loop
+thread's stack once a callback has held the loop past the threshold, so a
+block is reported with the task that caused it and the call it was stuck
+in (a psycopg2 query, a file write, an inline parse...). A probe task
+measures how late the loop wakes sleepers. Runs end with a report of the
+worst lag and of every blocking site, so serial points that cap
+concurrency show up in the log instead of only as a slow run.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+@dataclass
+class Block:
+    task: str           # coroutine of the blocking task, or the plain callback
+    where: str          # innermost frame in this project
+    call: str           # innermost frame overall: what it was actually stuck in
+    seconds: float
+    at: float           # time.monotonic() when it ended
+
+def _describe(frames: traceback.StackSummary) -> Tuple[str, str]:
+    """(innermost project frame, innermost frame) of a loop-thread stack"""
+    ours = [f for f in frames if f.filename.startswith(_HERE) and not f.filename.endswith('loop_monitor.py')]
+    where = f"{os.path.basename(ours[-1].filename)}:{ours[-1].lineno} {ours[-1].name}" if ours else '?'
+    last = frames[-1] if frames else None
+    call = f"{os.path.basename(last.filename)}:{last.lineno} {last.name}" if last else '?'
+    return where, call
+
+def _task_name(loop: asyncio.AbstractEventLoop, handle: asyncio.Handle) -> str:
+    """Coroutine of the task being stepped (stable across runs, unlike task names), else the callback"""
+    callback = getattr(handle, '_callback', None)
+    # current_task while a step is running; a step/wakeup callback is bound to its task either way
+    task = asyncio.current_task(loop) or getattr(callback, '__self__', None)
+    if isinstance(task, asyncio.Task):
+        coro = task.get_coro()
+        return getattr(coro, '__qualname__', None) or repr(coro)
+    return getattr(callback, '__qualname__', None) or repr(callback)
+
+class LoopMonitor:
+    """Install on a running loop with start(); report(since) summarises what happened after a mark()"""
+    
+    def __init__(self, block_threshold: float = 0.1, lag_interval: float = 0.1, max_blocks: int = 10000):
+        self.block_threshold = block_threshold
+        self.lag_interval = lag_interval
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.blocks: List[Block] = []
+        self.lags: List[Tuple[float, float]] = []   # (monotonic time, lag seconds)
+        self.max_blocks = max_blocks
+        self._current: Optional[Tuple[asyncio.Handle, float]] = None
+        self._captured: Dict[int, Tuple[str, str, str]] = {}
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._probe: Optional[asyncio.Task] = None
+    
+    @classmethod
+    def from_config(cls, config: dict) -> Optional['LoopMonitor']:
+        """Monitor when loop_monitor.enabled is set, else None"""
+        monitor_config = config.get('loop_monitor', {})
+        if not monitor_config.get('enabled', False):
+            return None
+        return cls(monitor_config.get('block_threshold_ms', 100) / 1000,
+                   monitor_config.get('lag_interval_ms', 100) / 1000)
+    
+    def start(self):
+        """Attach to the running loop (again, if a previous loop has closed)"""
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        if self.loop is not None:
+            self.stop()
+        self.loop = loop
+        self._thread_id = threading.get_ident()
+        _install(self)
+        self._stop = threading.Event()
+        threading.Thread(target=self._watchdog, args=(self._stop,), name='loop-monitor', daemon=True).start()
+        self._probe = loop.create_task(self._probe_lag(), name='loop-monitor-lag')
+    
+    def stop(self):
+        self._stop.set()
+        if self._probe is not None and not self.loop.is_closed():
+            self._probe.cancel()
+            self._probe = None
+        _uninstall(self)
+        self.loop = None
+    
+    def mark(self) -> float:
+        return time.monotonic()
+    
+    # Called from the patched Handle._run on the loop thread
+    def _enter(self, handle: asyncio.Handle):
+        self._current = (handle, time.perf_counter())
+    
+    def _exit(self, handle: asyncio.Handle):
+        current, self._current = self._current, None
+        if current is None:
+            return
+        elapsed = time.perf_counter() - current[1]
+        captured = self._captured.pop(id(handle), None)
+        if elapsed < self.block_threshold:
+            return
+        if captured is None:
+            # Ended before the watchdog looked: name it from what is left
+            captured = (_task_name(self.loop, handle), '?', '?')
+        if len(self.blocks) < self.max_blocks:
+            self.blocks.append(Block(*captured, elapsed, time.monotonic()))
+    
+    def _watchdog(self, stop: threading.Event):
+        """Snapshot the loop thread's stack while a callback is over the threshold"""
+        poll = self.block_threshold / 2
+        while not stop.wait(poll):
+            if self.loop is None or self.loop.is_closed():
+                return
+            current = self._current
+            if current is None:
+                continue
+            handle, started = current
+            if time.perf_counter() - started < self.block_threshold or id(handle) in self._captured:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            where, call = _describe(traceback.extract_stack(frame))
+            self._captured[id(handle)] = (_task_name(self.loop, handle), where, call)
+    
+    async def _probe_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(loop.time() - expected, 0.0)
+            self.lags.append((time.monotonic(), lag))
+            metrics.LOOP_LAG.set(lag)
+            metrics.LOOP_LAG_SECONDS.observe(lag)
+            if len(self.lags) > 100000:
+                del self.lags[:50000]
+    
+    def report(self, since: float = 0.0) -> List[str]:
+        """Report lines for lag samples and blocking sites recorded after since"""
+        lags = sorted(lag for at, lag in self.lags if at >= since)
+        lines = []
+        if lags:
+            p95 = lags[min(int(len(lags) * 0.95), len(lags) - 1)]
+            lines.append(f"Event-loop lag over {len(lags)} samples: median {lags[len(lags) // 2] * 1000:.1f} ms, "
+                         f"p95 {p95 * 1000:.1f} ms, max {lags[-1] * 1000:.1f} ms")
+        sites: Dict[Tuple[str, str, str], List[float]] = {}
+        for block in self.blocks:
+            if block.at >= since:
+                sites.setdefault((block.task, block.where, block.call), []).append(block.seconds)
+        ranked = sorted(sites.items(), key=lambda item: sum(item[1]), reverse=True)
+        for (task, where, call), seconds in ranked:
+            lines.append(f"Blocked the loop {len(seconds)}x, {sum(seconds) * 1000:.0f} ms total "
+                         f"(max {max(seconds) * 1000:.0f} ms): {task} at {where} in {call}")
+        if not ranked and lags:
+            lines.append(f"No callback held the loop longer than {self.block_threshold * 1000:.0f} ms")
+        return lines
+    
+    def log_report(self, since: float = 0.0):
+        for line in self.report(since):
+            logger.info(line)
+
+_monitors: Dict[int, LoopMonitor] = {}   # id(loop) -> monitor
+_original_run = asyncio.Handle._run
+
+def _monitored_run(self):
+    monitor = _monitors.get(id(self._loop))
+    if monitor is None:
+        return _original_run(self)
+    monitor._enter(self)
+    try:
+        return _original_run(self)
+    finally:
+        monitor._exit(self)
+
+def _install(monitor: LoopMonitor):
+    _monitors[id(monitor.loop)] = monitor
+    asyncio.Handle._run = _monitored_run
+
+def _uninstall(monitor: LoopMonitor):
+    if monitor.loop is not None:
+        _monitors.pop(id(monitor.loop), None)
+    if not _monitors:
+        asyncio.Handle._run = _original_run
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Prometheus-style metrics for the scraper
+A small in-process registry of counters, gauges and histograms rendered
+in the Prometheus text exposition format, served over aiohttp.web by the
+scheduler daemon (metrics.port in config.yaml). Instrumentation points
+call the module-level metrics below; they are cheap and thread-safe, so
+saver threads record into them too.
+
+    curl -s localhost:9108/metrics | grep etf_fetch_seconds
+"""
+
+import asyncio
+import math
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+class _Metric:
+    kind = ''
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+    
+    def samples(self) -> List[Tuple[str, Sequence[str], Sequence[str], float]]:
+        raise NotImplementedError
+    
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for suffix, names, values, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+class Counter(_Metric):
+    kind = 'counter'
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def samples(self):
+        with self._lock:
+            return [('_total', self.labelnames, key, v) for key, v in sorted(self._values.items())]
+
+class Gauge(_Metric):
+    kind = 'gauge'
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+    
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+    
+    def set_function(self, fn: Optional[Callable[[], float]], **labels):
+        """Read the value from fn at scrape time (None removes it)"""
+        key = self._key(labels)
+        with self._lock:
+            if fn is None:
+                self._functions.pop(key, None)
+            else:
+                self._functions[key] = fn
+    
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                logger.exception(f"{self.name}: gauge callback failed")
+        return [('', self.labelnames, key, v) for key, v in sorted(values.items())]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+    
+    def samples(self):
+        names = self.labelnames + ('le',)
+        out = []
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    out.append(('_bucket', names, key + (_format_value(bound),), cumulative))
+                out.append(('_sum', self.labelnames, key, self._sums[key]))
+                out.append(('_count', self.labelnames, key, cumulative))
+        return out
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+    
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+    
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+    
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labelnames)
+    
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets)
+    
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(m.render() for m in metrics) + '\n'
+
+REGISTRY = Registry()
+
+FETCH_SECONDS = REGISTRY.histogram('etf_fetch_seconds', 'Page fetch latency per attempt', ('provider', 'route'))
+FETCHES = REGISTRY.counter('etf_fetches', 'Fetch attempts by outcome (ok, not_modified, error)',
+                           ('provider', 'route', 'outcome'))
+FETCH_BYTES = REGISTRY.counter('etf_fetch_bytes', 'Page bytes downloaded', ('provider', 'route'))
+ZYTE_BYTES = REGISTRY.counter('etf_zyte_response_bytes', 'Zyte API response bytes received (base64 JSON)')
+ZYTE_BILLABLE = REGISTRY.counter('etf_zyte_billable_requests',
+                                 'Zyte API requests answered with a site response, each billed one request credit')
+PARSE_SECONDS = REGISTRY.histogram('etf_parse_seconds', 'Page parse time, including the wait for a pool worker',
+                                   ('provider', 'cache'))
+SAVE_SECONDS = REGISTRY.histogram('etf_save_seconds', 'Batched COPY + merge transaction time')
+ROWS_WRITTEN = REGISTRY.counter('etf_rows_written', 'Holdings rows written by the merge', ('operation',))
+SAVE_ROWS_PER_SEC = REGISTRY.gauge('etf_save_rows_per_second', 'Rows copied per second in the last save')
+UNITS = REGISTRY.counter('etf_units', 'ETF (or ETF/date) units finished, by outcome', ('status',))
+QUEUE_DEPTH = REGISTRY.gauge('etf_queue_depth', 'Work waiting per pipeline queue', ('queue',))
+FETCHES_IN_FLIGHT = REGISTRY.gauge('etf_fetches_in_flight', 'Fetches holding a scheduler slot')
+LOOP_LAG = REGISTRY.gauge('etf_event_loop_lag_seconds', 'Most recent event-loop scheduling delay')
+LOOP_LAG_SECONDS = REGISTRY.histogram('etf_event_loop_lag_sample_seconds', 'Event-loop scheduling delay samples',
+                                      buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+JOB_RUNS = REGISTRY.counter('etf_scheduler_job_runs', 'Scheduler job executions by outcome', ('job', 'outcome'))
+PROCESS_START = REGISTRY.gauge('etf_process_start_time_seconds', 'Unix time the process started')
+PROCESS_START.set(time.time())
+JOB_LAST_SUCCESS = REGISTRY.gauge('etf_scheduler_job_last_success_timestamp_seconds',
+                                  'Unix time of the last successful run per job', ('job',))
+
+async def probe_loop_lag(interval: float = 0.5):
+    """Sleep interval at a time and record how late the loop woke us; run as a background task"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - expected, 0.0)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_SECONDS.observe(lag)
+
+async def start_server(host: str = '0.0.0.0', port: int = 9108,
+                       registry: Registry = REGISTRY) -> web.AppRunner:
+    """Serve GET /metrics; returns the runner so the caller can clean it up"""
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+    
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics at http://{host}:{port}/metrics")
+    return runner
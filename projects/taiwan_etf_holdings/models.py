@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Shared data types for the Taiwan ETF holdings pipeline
+"""
+
+import re
+import sys
+from array import array
+from datetime import date
+from typing import Iterator, List, Optional, Tuple
+from dataclasses import dataclass
+
+@dataclass
+class ETFConfig:
+    symbol: str
+    name: str
+    provider: str
+    type: str
+    url: str
+    priority: int = 0
+    history_url: Optional[str] = None   # str.format template with {date}, e.g. ...?date={date:%Y%m%d}
+
+@dataclass(slots=True)
+class Holding:
+    etf_symbol: str
+    trade_date: date
+    holding_date: date
+    rank: int
+    isin: Optional[str]
+    issuer_name: str
+    security_name: str
+    security_type: str
+    shares_held: float
+    market_value_twd: float
+    weight_pct: float
+    source_url: str
+
+class HoldingBatch:
+    """
+    One ETF snapshot stored column-wise: the per-page values (ETF, dates,
+    source URL) once, numbers in typed arrays and strings in plain lists.
+    This is what parsers return and what flows through the parse cache and
+    the bulk loader; iterate it for Holding records when those are handier.
+    """
+    
+    __slots__ = ('etf_symbol', 'trade_date', 'holding_date', 'source_url',
+                 'rank', 'isin', 'issuer_name', 'security_name', 'security_type',
+                 'shares_held', 'market_value_twd', 'weight_pct')
+    
+    def __init__(self, etf_symbol: str, trade_date: date, holding_date: Optional[date] = None,
+                 source_url: str = ''):
+        self.etf_symbol = etf_symbol
+        self.trade_date = trade_date
+        self.holding_date = holding_date or trade_date
+        self.source_url = source_url
+        self.rank = array('l')
+        self.isin: List[Optional[str]] = []
+        self.issuer_name: List[str] = []
+        self.security_name: List[str] = []
+        self.security_type: List[str] = []
+        self.shares_held = array('d')
+        self.market_value_twd = array('d')
+        self.weight_pct = array('d')
+    
+    def append(self, rank: int, isin: Optional[str], issuer_name: str, security_name: str,
+               security_type: str, shares_held: float, market_value_twd: float, weight_pct: float):
+        self.rank.append(rank)
+        self.isin.append(isin)
+        self.issuer_name.append(issuer_name)
+        self.security_name.append(security_name)
+        # A page repeats a handful of security types; share one string per value
+        self.security_type.append(sys.intern(security_type))
+        self.shares_held.append(shares_held)
+        self.market_value_twd.append(market_value_twd)
+        self.weight_pct.append(weight_pct)
+    
+    def __len__(self) -> int:
+        return len(self.rank)
+    
+    def rows(self) -> Iterator[Tuple]:
+        """Per-row columns (rank .. weight_pct), without the per-page values"""
+        return zip(self.rank, self.isin, self.issuer_name, self.security_name, self.security_type,
+                   self.shares_held, self.market_value_twd, self.weight_pct)
+    
+    def __iter__(self) -> Iterator[Holding]:
+        for row in self.rows():
+            yield Holding(self.etf_symbol, self.trade_date, self.holding_date, *row, self.source_url)
+    
+    def __repr__(self) -> str:
+        return f"HoldingBatch({self.etf_symbol!r}, {self.trade_date}, {len(self)} rows)"
+
+ISIN_RE = re.compile(r'^[A-Z]{2}[A-Z0-9]{9}[0-9]$')
+TW_CODE_RE = re.compile(r'^[0-9]{4,6}[A-Z]?$')
+
+def isin_check_digit(body: str) -> str:
+    """ISIN check digit (Luhn over the letters-as-numbers expansion of the first 11 chars)"""
+    digits = ''.join(str(int(c, 36)) for c in body)
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = int(ch)
+        if i % 2 == 0:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return str((10 - total % 10) % 10)
+
+def tw_isin(code: str) -> Optional[str]:
+    """ISIN for a TWSE/TPEx security code or an ISIN passed through, e.g. 2330 -> TW0002330008"""
+    code = code.strip().upper()
+    if ISIN_RE.match(code):
+        return code
+    if not TW_CODE_RE.match(code):
+        return None
+    body = ('TW000' + code).ljust(11, '0')
+    return body + isin_check_digit(body)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Nuxt SSR state extraction
+Reads window.__NUXT__ out of server-rendered pages without building a DOM
+"""
+
+import json
+import re
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Sequence, Union
+
+NUXT_MARKER = 'window.__NUXT__='
+SCRIPT_END = '</script>'
+
+# One scan per region: strings are consumed whole so nothing inside them is rewritten
+_JS_TOKEN_RE = re.compile(r'''
+      (?P<string>"(?:[^"\\]|\\.)*")
+    | (?P<assign>(?:^|(?<=;))([A-Za-z_$][\w$]*)\.([A-Za-z_$][\w$]*)=)
+    | (?P<key>(?<=[{,])[A-Za-z_$0-9][\w$]*(?=:))
+    | (?P<void>\bvoid\s+0\b)
+    | (?P<number>(?<![\w$.])-?\.[0-9]+(?:[eE][+-]?[0-9]+)?)
+    | (?P<ident>(?<![\w$."])[A-Za-z_$][\w$]*)
+    | (?P<semi>;)
+''', re.X)
+
+_REF = '\x00ref'
+_LITERALS = {'true', 'false', 'null'}
+
+class NuxtStateError(ValueError):
+    """The page has a __NUXT__ script this extractor cannot evaluate"""
+
+@contextmanager
+def _evaluating(what: str):
+    """Report any failure while evaluating the state as NuxtStateError, so parsers can fall back"""
+    try:
+        yield
+    except NuxtStateError:
+        raise
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError, RecursionError) as e:
+        raise NuxtStateError(f"Cannot evaluate __NUXT__ {what}: {type(e).__name__}: {e}") from e
+
+def _to_json(js: str, env: Dict[str, Any]) -> str:
+    """Rewrite a JS literal expression (unquoted keys, identifiers, .5, void 0) as JSON"""
+    def replace(m: re.Match) -> str:
+        kind = m.lastgroup
+        text = m.group(0)
+        if kind == 'string':
+            return text
+        if kind == 'key':
+            return f'"{text}"'
+        if kind == 'void':
+            return 'null'
+        if kind == 'number':
+            return text.replace('.', '0.', 1)
+        if kind == 'semi':
+            return ']\n'
+        if kind == 'assign':
+            return f'[{json.dumps(m.group(3))},{json.dumps(m.group(4))},'
+        if text in _LITERALS:
+            return text
+        if text not in env:
+            raise NuxtStateError(f"Unbound identifier {text!r}")
+        value = env[text]
+        if isinstance(value, (dict, list)):
+            return json.dumps({_REF: text})
+        return json.dumps(value, ensure_ascii=False)
+    return _JS_TOKEN_RE.sub(replace, js)
+
+def _loads(text: str, env: Dict[str, Any]) -> Any:
+    def resolve(obj: dict):
+        if len(obj) == 1 and _REF in obj:
+            return env[obj[_REF]]
+        return obj
+    try:
+        return json.loads(text, object_hook=resolve, strict=False)
+    except json.JSONDecodeError as e:
+        raise NuxtStateError(f"Cannot decode __NUXT__ state: {e}") from e
+
+_BRACKET_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}]')
+
+def _closing_bracket(js: str, start: int) -> int:
+    """Index just past the bracket that closes the one at js[start]"""
+    depth = 0
+    for m in _BRACKET_RE.finditer(js, start):
+        ch = m.group(0)
+        if ch in '[{':
+            depth += 1
+        elif ch in ']}':
+            depth -= 1
+            if depth == 0:
+                return m.end()
+    raise NuxtStateError("Unbalanced brackets in __NUXT__ state")
+
+def find_nuxt_script(html: Union[str, bytes]) -> Optional[str]:
+    """Slice the __NUXT__ assignment out of the page, decoding only that part"""
+    if isinstance(html, (bytes, bytearray, memoryview)):
+        page = bytes(html) if isinstance(html, memoryview) else html
+        start = page.find(NUXT_MARKER.encode())
+        if start < 0:
+            return None
+        end = page.find(SCRIPT_END.encode(), start)
+        return page[start:end if end >= 0 else len(page)].decode('utf-8', errors='ignore')
+    start = html.find(NUXT_MARKER)
+    if start < 0:
+        return None
+    end = html.find(SCRIPT_END, start)
+    return html[start:end if end >= 0 else len(html)]
+
+class NuxtState:
+    """
+    The state script Nuxt 2 emits, either
+        window.__NUXT__=(function(a,b,...){x.k=v;...return {...}}(arg1,arg2,...));
+    or the plain object form window.__NUXT__={...};
+    
+    Arguments and the few leading assignments are evaluated up front; the
+    (large) returned object is only converted on demand, either whole via
+    evaluate() or one subtree at a time via find().
+    """
+    
+    def __init__(self, script: str):
+        expr = script[len(NUXT_MARKER):].strip().rstrip(';').strip()
+        self.env: Dict[str, Any] = {}
+        if expr.startswith('{'):
+            self.returned = expr
+            return
+        if not expr.startswith('(function('):
+            raise NuxtStateError("Unrecognised __NUXT__ expression")
+        with _evaluating('function'):
+            self._call(expr)
+    
+    def _call(self, expr: str):
+        """Bind the IIFE's parameters, run its leading assignments and keep the returned expression"""
+        params_end = expr.find(')')
+        if params_end < 0:
+            raise NuxtStateError("Unterminated __NUXT__ parameter list")
+        params = [p.strip() for p in expr[len('(function('):params_end].split(',') if p.strip()]
+        args_start = expr.rfind('}(')
+        if args_start < 0 or not expr.endswith('))'):
+            raise NuxtStateError("Cannot locate __NUXT__ call arguments")
+        
+        args = _loads('[' + _to_json(expr[args_start + 2:-2], {}) + ']', {})
+        if len(args) < len(params):
+            args.extend([None] * (len(params) - len(args)))
+        self.env = dict(zip(params, args))
+        
+        body = expr[params_end + 2:args_start]
+        returned_at = body.find('return')
+        while returned_at > 0 and body[returned_at - 1] not in ';}':
+            returned_at = body.find('return', returned_at + 1)
+        if returned_at < 0:
+            raise NuxtStateError("No return statement in __NUXT__ function")
+        statements = _to_json(body[:returned_at], self.env)
+        for target, key, value in _loads('[' + statements.replace(']\n', '],') + '0]', self.env)[:-1]:
+            if not isinstance(self.env.get(target), dict):
+                raise NuxtStateError(f"Assignment to unknown object {target!r}")
+            self.env[target][key] = value
+        self.returned = body[returned_at + len('return'):].strip()
+    
+    def evaluate(self) -> Any:
+        """The whole state object"""
+        with _evaluating('state'):
+            return _loads(_to_json(self.returned, self.env).replace(']\n', ''), self.env)
+    
+    def find(self, keys: Sequence[str]) -> Optional[Any]:
+        """Evaluate only the first object/array stored under one of keys"""
+        with _evaluating('state'):
+            return self._find(keys)
+    
+    def _find(self, keys: Sequence[str]) -> Optional[Any]:
+        js = self.returned
+        for key in keys:
+            for lead in ',{':
+                at = js.find(f'{lead}{key}:')
+                while at >= 0:
+                    start = at + len(key) + 2
+                    if js[start:start + 1] in ('[', '{'):
+                        end = _closing_bracket(js, start)
+                        return _loads(_to_json(js[start:end], self.env), self.env)
+                    at = js.find(f'{lead}{key}:', start)
+        return None
+
+def extract_nuxt_state(html: Union[str, bytes]) -> Optional[NuxtState]:
+    """The page's __NUXT__ state, or None when the page has none"""
+    script = find_nuxt_script(html)
+    if script is None:
+        return None
+    return NuxtState(script)
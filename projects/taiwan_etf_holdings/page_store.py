@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Content-addressed raw page store
+Keeps every fetched page gzip-compressed under its SHA-256, plus per-URL
+validators (ETag / Last-Modified) and the hash of the last page that made
+it into the database, so unchanged pages can skip parsing and saving. The index is written once
+per run; objects no URL points at any more are pruned after max_age_days.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class PageMeta:
+    url: str
+    sha256: str
+    size: int
+    fetched_at: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    ingested_sha256: Optional[str] = None
+    
+    @property
+    def ingested(self) -> bool:
+        return self.ingested_sha256 == self.sha256
+    
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers for the next fetch of this URL"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+class PageStore:
+    def __init__(self, root: str = 'pages', max_age_days: Optional[float] = None):
+        self.root = root
+        self.max_age_days = max_age_days
+        self.index_path = os.path.join(root, 'index.json')
+        self._lock = threading.Lock()
+        self._index: Dict[str, PageMeta] = {}
+        self._dirty = False
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self._index = {url: PageMeta(**m) for url, m in json.load(f).items()}
+    
+    def _object_path(self, sha: str) -> str:
+        return os.path.join(self.root, 'objects', sha[:2], f'{sha}.html.gz')
+    
+    def meta(self, url: str) -> Optional[PageMeta]:
+        with self._lock:
+            return self._index.get(url)
+    
+    def get(self, sha: str) -> bytes:
+        with gzip.open(self._object_path(sha), 'rb') as f:
+            return f.read()
+    
+    def put(self, url: str, body: bytes, etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> Tuple[PageMeta, bool]:
+        """Store body; returns its metadata and whether it differs from the last ingested page"""
+        sha = hashlib.sha256(body).hexdigest()
+        path = self._object_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.tmp'
+            with gzip.open(tmp, 'wb', compresslevel=6) as f:
+                f.write(body)
+            os.replace(tmp, path)
+        with self._lock:
+            previous = self._index.get(url)
+            meta = PageMeta(
+                url=url, sha256=sha, size=len(body),
+                fetched_at=datetime.now().isoformat(timespec='seconds'),
+                etag=etag, last_modified=last_modified,
+                ingested_sha256=previous.ingested_sha256 if previous else None,
+            )
+            self._index[url] = meta
+            self._dirty = True
+        return meta, not meta.ingested
+    
+    def touch(self, url: str):
+        """Record a 304 Not Modified re-validation"""
+        with self._lock:
+            if url in self._index:
+                self._index[url].fetched_at = datetime.now().isoformat(timespec='seconds')
+                self._dirty = True
+    
+    def mark_ingested(self, url: str, sha: str):
+        """Call once the holdings parsed from this page are safely in the database"""
+        with self._lock:
+            if url in self._index:
+                self._index[url].ingested_sha256 = sha
+                self._dirty = True
+    
+    def prune(self) -> int:
+        """Delete objects older than max_age_days that no URL's current or ingested page is; returns the count"""
+        if not self.max_age_days:
+            return 0
+        cutoff = time.time() - self.max_age_days * 86400
+        with self._lock:
+            keep = {sha for m in self._index.values() for sha in (m.sha256, m.ingested_sha256) if sha}
+        removed = 0
+        objects = os.path.join(self.root, 'objects')
+        for dirpath, _, filenames in os.walk(objects):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if name.split('.', 1)[0] in keep:
+                    continue
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        if removed:
+            logger.info(f"Pruned {removed} pages older than {self.max_age_days:g} days from {objects}")
+        return removed
+    
+    def save(self):
+        """Write the index if anything changed since the last save; call once per run, off the event loop"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {url: asdict(m) for url, m in self._index.items()}
+            self._dirty = False
+        tmp = f'{self.index_path}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.index_path)
+        except OSError:
+            with self._lock:
+                self._dirty = True
+            raise
+    
+    def flush(self):
+        """End-of-run housekeeping: prune expired objects, then write the index"""
+        self.prune()
+        self.save()
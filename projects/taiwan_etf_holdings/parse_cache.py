@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Persistent parse-result cache
+Maps (parser, parser version, page SHA-256, ETF, trade date) to the parsed
+holdings, stored column-wise with marshal + zlib in a size-bounded SQLite LRU.
+"""
+
+import marshal
+import sqlite3
+import threading
+import time
+import zlib
+import logging
+from array import array
+from datetime import date
+from typing import Optional
+
+from models import HoldingBatch
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+_ARRAY_COLUMNS = ('rank', 'shares_held', 'market_value_twd', 'weight_pct')
+_LIST_COLUMNS = ('isin', 'issuer_name', 'security_name', 'security_type')
+
+def encode_holdings(batch: HoldingBatch) -> bytes:
+    """Batch columns (typed arrays as raw bytes, dates as ordinals) -> marshal -> zlib"""
+    return zlib.compress(marshal.dumps((
+        FORMAT_VERSION, batch.etf_symbol, batch.trade_date.toordinal(),
+        batch.holding_date.toordinal(), batch.source_url,
+        tuple(getattr(batch, name).tobytes() for name in _ARRAY_COLUMNS),
+        tuple(tuple(getattr(batch, name)) for name in _LIST_COLUMNS),
+    )), 6)
+
+def decode_holdings(blob: bytes) -> HoldingBatch:
+    version, *header, arrays, lists = marshal.loads(zlib.decompress(blob))
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported parse cache format {version}")
+    etf_symbol, trade_date, holding_date, source_url = header
+    batch = HoldingBatch(etf_symbol, date.fromordinal(trade_date), date.fromordinal(holding_date), source_url)
+    for name, raw in zip(_ARRAY_COLUMNS, arrays):
+        column = array(getattr(batch, name).typecode)
+        column.frombytes(raw)
+        setattr(batch, name, column)
+    for name, values in zip(_LIST_COLUMNS, lists):
+        setattr(batch, name, list(values))
+    return batch
+
+class ParseCache:
+    def __init__(self, path: str = 'parse_cache.sqlite', max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS parse_cache (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_parse_cache_lru ON parse_cache(last_used)')
+    
+    @staticmethod
+    def key(parser, page_sha: str, etf_symbol: str, trade_date: date) -> str:
+        return f"{parser.provider}@{parser.version}:{page_sha}:{etf_symbol}:{trade_date.isoformat()}"
+    
+    def get(self, parser, page_sha: str, etf_symbol: str, trade_date: date) -> Optional[HoldingBatch]:
+        key = self.key(parser, page_sha, etf_symbol, trade_date)
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM parse_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE parse_cache SET last_used = ? WHERE key = ?', (time.time(), key))
+        try:
+            return decode_holdings(row[0])
+        except ValueError as e:
+            # Entry written by an older format: treat as a miss, the put() that follows replaces it
+            logger.info(f"Parse cache entry {key} unreadable ({e})")
+            return None
+    
+    def put(self, parser, page_sha: str, etf_symbol: str, trade_date: date, holdings: HoldingBatch):
+        key = self.key(parser, page_sha, etf_symbol, trade_date)
+        blob = encode_holdings(holdings)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO parse_cache (key, data, size, last_used) VALUES (?, ?, ?, ?)',
+                (key, blob, len(blob), time.time())
+            )
+            self._evict()
+    
+    def _evict(self):
+        """Drop least-recently-used entries beyond max_bytes"""
+        cursor = self._conn.execute('''
+            DELETE FROM parse_cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS running
+                    FROM parse_cache
+                ) WHERE running > ?
+            )
+        ''', (self.max_bytes,))
+        if cursor.rowcount:
+            logger.info(f"Parse cache evicted {cursor.rowcount} entries")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Holdings page parsers, registered per ETFConfig.provider
+"""
+
+import logging
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from bs4 import BeautifulSoup
+
+from models import HoldingBatch, tw_isin
+from nuxt_state import NuxtStateError, extract_nuxt_state
+
+logger = logging.getLogger(__name__)
+
+# parser(html, etf_symbol, source_url, trade_date) -> HoldingBatch; html is str or raw
+# page bytes, trade_date defaults to today (backfills pass the snapshot's date)
+Page = Union[str, bytes, bytearray]
+Parser = Callable[[Page, str, str, Optional[date]], HoldingBatch]
+
+PARSERS: Dict[str, Parser] = {}
+DEFAULT_PARSER = 'table'
+
+def register_parser(provider: str, version: int = 1):
+    """Register a parser for a provider; bump version whenever its output changes"""
+    def decorator(fn: Parser) -> Parser:
+        fn.provider = provider
+        fn.version = version
+        PARSERS[provider] = fn
+        return fn
+    return decorator
+
+def get_parser(provider: Optional[str]) -> Parser:
+    return PARSERS.get(provider) or PARSERS[DEFAULT_PARSER]
+
+def parse_page(provider: Optional[str], html: Page, etf_symbol: str, source_url: str = '',
+               trade_date: Optional[date] = None) -> HoldingBatch:
+    """Module-level entry point so process pools can pickle it"""
+    return get_parser(provider)(html, etf_symbol, source_url, trade_date)
+
+def _number(value: Any) -> float:
+    """Cell value as a float; blank or placeholder cells ('-', 'N/A') count as 0"""
+    if value is None or value == '':
+        return 0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '').replace('%', '').strip() or 0)
+    except ValueError:
+        return 0
+
+def _rank(value: Any, default: int) -> int:
+    """Rank cell as an int ('3', 3.0 and '3.0' alike), else the row's position"""
+    try:
+        return int(float(str(value).replace(',', '').strip()))
+    except (TypeError, ValueError, OverflowError):
+        return default
+
+@register_parser('table')
+def parse_table_holdings(html: Page, etf_symbol: str, source_url: str = '',
+                         trade_date: Optional[date] = None) -> HoldingBatch:
+    """Generic parser: every <tr> of every <table> with at least four cells"""
+    holdings = HoldingBatch(etf_symbol, trade_date or date.today(), source_url=source_url)
+    if isinstance(html, bytearray):
+        html = bytes(html)  # bs4 only sniffs str/bytes
+    soup = BeautifulSoup(html, 'lxml')
+    tables = soup.find_all('table')
+    
+    for table in tables:
+        rows = table.find_all('tr')
+        for row in rows[1:]:
+            cols = row.find_all(['td', 'th'])
+            if len(cols) >= 4:
+                try:
+                    weight = float(cols[-1].get_text(strip=True).replace('%', '').replace(',', '')) if cols[-1].get_text(strip=True) else 0
+                    holdings.append(
+                        rank=len(holdings) + 1,
+                        isin=tw_isin(cols[0].get_text(strip=True)),
+                        issuer_name=cols[0].get_text(strip=True),
+                        security_name=cols[1].get_text(strip=True) if len(cols) > 1 else '',
+                        security_type='',
+                        shares_held=0,
+                        market_value_twd=0,
+                        weight_pct=weight,
+                    )
+                except (ValueError, IndexError):
+                    continue
+    return holdings
+
+# Yuanta renders holdings client-side from the Nuxt state; these are the
+# state keys and row fields seen across its product pages
+YUANTA_HOLDINGS_KEYS = ('StockWeights', 'stockWeights', 'FundWeights', 'fundWeights', 'Holdings')
+CODE_KEYS = ('code', 'Code', 'STK_CD', 'StockCode', 'stkcd')
+ISIN_KEYS = ('isin', 'ISIN', 'ISINCODE')
+NAME_KEYS = ('name', 'Name', 'STK_NAME', 'StockName')
+ENAME_KEYS = ('ename', 'EName', 'STK_ENAME')
+TYPE_KEYS = ('type', 'Type', 'STK_TYPE')
+WEIGHT_KEYS = ('weights', 'Weights', 'weight', 'Weight', 'WEIGHTS')
+SHARES_KEYS = ('qty', 'Qty', 'QTY', 'shares', 'Shares')
+VALUE_KEYS = ('amount', 'Amount', 'AMOUNT', 'value', 'MarketValue')
+RANK_KEYS = ('ordinal', 'Ordinal', 'rank')
+
+def _first(row: dict, keys) -> Any:
+    for key in keys:
+        if key in row and row[key] is not None:
+            return row[key]
+    return None
+
+def _holding_rows(node: Any) -> Optional[List[dict]]:
+    """First list of dicts in node that look like holdings (a code and a weight)"""
+    if isinstance(node, list):
+        if node and all(isinstance(r, dict) for r in node) \
+                and _first(node[0], CODE_KEYS) is not None \
+                and _first(node[0], WEIGHT_KEYS) is not None:
+            return node
+        children = node
+    elif isinstance(node, dict):
+        children = node.values()
+    else:
+        return None
+    for child in children:
+        rows = _holding_rows(child)
+        if rows is not None:
+            return rows
+    return None
+
+@register_parser('yuanta')
+def parse_yuanta_holdings(html: Page, etf_symbol: str, source_url: str = '',
+                          trade_date: Optional[date] = None) -> HoldingBatch:
+    """Read holdings from window.__NUXT__ without building a DOM; table parser for non-Nuxt pages"""
+    try:
+        state = extract_nuxt_state(html)
+        node = state.find(YUANTA_HOLDINGS_KEYS) if state is not None else None
+    except NuxtStateError as e:
+        logger.warning(f"{etf_symbol}: unreadable __NUXT__ state ({e}), falling back to tables")
+        state = None
+    if state is None:
+        return parse_table_holdings(html, etf_symbol, source_url, trade_date)
+    
+    rows = _holding_rows(node) or []
+    if not rows:
+        logger.info(f"{etf_symbol}: no holdings in __NUXT__ state")
+    holdings = HoldingBatch(etf_symbol, trade_date or date.today(), source_url=source_url)
+    for i, row in enumerate(rows):
+        code = str(_first(row, CODE_KEYS) or '').strip()
+        holdings.append(
+            rank=_rank(_first(row, RANK_KEYS), i + 1),
+            isin=tw_isin(str(_first(row, ISIN_KEYS) or code)),
+            issuer_name=code,
+            security_name=str(_first(row, NAME_KEYS) or _first(row, ENAME_KEYS) or ''),
+            security_type=str(_first(row, TYPE_KEYS) or ''),
+            shares_held=_number(_first(row, SHARES_KEYS)),
+            market_value_twd=_number(_first(row, VALUE_KEYS)),
+            weight_pct=_number(_first(row, WEIGHT_KEYS)),
+        )
+    return holdings
@@ -4,17 +4,33 @@ Query Taiwan ETF Holdings from PostgreSQL
 """
 
 import yaml
+import atexit
+import threading
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from contextlib import contextmanager
 from datetime import date, timedelta
-from typing import Optional
+from functools import lru_cache
+from typing import Iterator, Optional, Tuple
 import os
 
-def get_db_connection():
-    with open("config.yaml") as f:
-        config = yaml.safe_load(f)
-    db = config['database']
-    return psycopg2.connect(
+CONFIG_PATH = "config.yaml"
+
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def load_config(path: str = CONFIG_PATH) -> dict:
+    """Parse config.yaml once per process"""
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+def _connect_kwargs() -> dict:
+    db = load_config()['database']
+    return dict(
         host=db['host'],
         port=db['port'],
         database=db['name'],
@@ -22,81 +38,261 @@ def get_db_connection():
         password=os.getenv('DB_PASSWORD', db.get('password', ''))
     )
 
-def query_holdings(etf_symbol: str, days: int = 7) -> pd.DataFrame:
-    """Get recent holdings for an ETF"""
-    conn = get_db_connection()
-    df = pd.read_sql_query('''
-        SELECT 
-            trade_date, 
-            rank, 
-            issuer_name, 
-            security_name, 
-            shares_held, 
-            ROUND(weight_pct * 100, 2) as weight_pct,
-            market_value_twd
-        FROM etf_holdings
-        WHERE etf_symbol = %s
-        ORDER BY trade_date DESC, rank ASC
-        LIMIT %s
-    ''', conn, params=(etf_symbol, days * 100))
-    conn.close()
-    return df
-
-def query_changes(etf_symbol: str, days: int = 7) -> pd.DataFrame:
-    """Get recent changes for an ETF"""
-    conn = get_db_connection()
-    df = pd.read_sql_query('''
-        SELECT 
-            trade_date,
-            isin,
-            change_type,
-            ROUND(shares_change, 0) as shares_change,
-            ROUND(weight_change * 100, 4) as weight_change_pct
-        FROM etf_holding_changes
-        WHERE etf_symbol = %s
-        ORDER BY trade_date DESC
-        LIMIT %s
-    ''', conn, params=(etf_symbol, days * 50))
-    conn.close()
-    return df
+def get_db_connection():
+    """A dedicated connection the caller must close (prefer db_connection())"""
+    return psycopg2.connect(**_connect_kwargs())
+
+def get_pool() -> ThreadedConnectionPool:
+    """Process-wide pool, created on first use (database.pool_min / pool_max)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                db = load_config()['database']
+                _pool = ThreadedConnectionPool(
+                    db.get('pool_min', 1), db.get('pool_max', 5), **_connect_kwargs()
+                )
+    return _pool
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection; its transaction is ended before it goes back"""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+@atexit.register
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        _pool = None
+
+HOLDING_COLUMNS = '''
+    trade_date, 
+    rank, 
+    issuer_name, 
+    security_name, 
+    shares_held, 
+    ROUND(weight_pct * 100, 2) as weight_pct,
+    market_value_twd
+'''
+
+def date_window(days: int = 7, start_date: Optional[date] = None,
+                end_date: Optional[date] = None) -> Tuple[date, date]:
+    """Inclusive [start, end]; by default the `days` calendar days ending today"""
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=days - 1)
+    return start_date, end_date
+
+def query_holdings(etf_symbol: str, days: int = 7, start_date: Optional[date] = None,
+                   end_date: Optional[date] = None) -> pd.DataFrame:
+    """Get holdings for an ETF over a trade_date window"""
+    start_date, end_date = date_window(days, start_date, end_date)
+    with db_connection() as conn:
+        return pd.read_sql_query(f'''
+            SELECT {HOLDING_COLUMNS}
+            FROM etf_holdings
+            WHERE etf_symbol = %s AND trade_date BETWEEN %s AND %s
+            ORDER BY trade_date DESC, rank ASC
+        ''', conn, params=(etf_symbol, start_date, end_date))
+
+HoldingsCursor = Tuple[date, Optional[int], int]
+
+def query_holdings_page(etf_symbol: str, after: Optional[HoldingsCursor] = None,
+                        page_size: int = 1000, start_date: Optional[date] = None,
+                        end_date: Optional[date] = None) -> Tuple[pd.DataFrame, Optional[HoldingsCursor]]:
+    """
+    One keyset page ordered (trade_date DESC, rank ASC NULLS LAST, id). Pass
+    the returned cursor back as `after` for the next page; it is None after
+    the last page. id breaks ties, so equal or missing ranks are never skipped.
+    """
+    conditions = ['etf_symbol = %s']
+    params: list = [etf_symbol]
+    if start_date:
+        conditions.append('trade_date >= %s')
+        params.append(start_date)
+    if end_date:
+        conditions.append('trade_date <= %s')
+        params.append(end_date)
+    if after:
+        after_date, after_rank, after_id = after
+        # trade_date <= bounds the index scan; the OR resumes mid-day. Unranked
+        # rows sort last within a day, so a ranked cursor is followed by them too
+        if after_rank is None:
+            conditions.append('trade_date <= %s AND (trade_date < %s OR (rank IS NULL AND id > %s))')
+            params.extend([after_date, after_date, after_id])
+        else:
+            conditions.append('trade_date <= %s AND (trade_date < %s OR rank > %s OR rank IS NULL '
+                              'OR (rank = %s AND id > %s))')
+            params.extend([after_date, after_date, after_rank, after_rank, after_id])
+    with db_connection() as conn:
+        df = pd.read_sql_query(f'''
+            SELECT {HOLDING_COLUMNS}, id
+            FROM etf_holdings
+            WHERE {' AND '.join(conditions)}
+            ORDER BY trade_date DESC, rank ASC NULLS LAST, id ASC
+            LIMIT %s
+        ''', conn, params=(*params, page_size))
+    last = df.iloc[-1] if len(df) == page_size else None
+    df = df.drop(columns='id')
+    if last is None:
+        return df, None
+    rank = None if pd.isna(last['rank']) else int(last['rank'])
+    return df, (last['trade_date'], rank, int(last['id']))
+
+def iter_holdings_pages(etf_symbol: str, page_size: int = 1000, start_date: Optional[date] = None,
+                        end_date: Optional[date] = None) -> Iterator[pd.DataFrame]:
+    """Stream an ETF's full (or windowed) history page by page"""
+    after = None
+    while True:
+        df, after = query_holdings_page(etf_symbol, after, page_size, start_date, end_date)
+        if not df.empty:
+            yield df
+        if after is None:
+            return
+
+def query_changes(etf_symbol: str, days: int = 7, start_date: Optional[date] = None,
+                  end_date: Optional[date] = None) -> pd.DataFrame:
+    """Get changes for an ETF over a trade_date window"""
+    start_date, end_date = date_window(days, start_date, end_date)
+    with db_connection() as conn:
+        return pd.read_sql_query('''
+            SELECT 
+                trade_date,
+                isin,
+                security_name,
+                change_type,
+                ROUND(shares_change, 0) as shares_change,
+                ROUND(weight_change * 100, 4) as weight_change_pct
+            FROM etf_holding_changes
+            WHERE etf_symbol = %s AND trade_date BETWEEN %s AND %s
+            ORDER BY trade_date DESC, ABS(weight_change) DESC
+        ''', conn, params=(etf_symbol, start_date, end_date))
+
+EXPORT_SCHEMA = pa.schema([
+    ('etf_symbol', pa.string()),
+    ('trade_date', pa.date32()),
+    ('holding_date', pa.date32()),
+    ('rank', pa.int32()),
+    ('isin', pa.string()),
+    ('issuer_name', pa.string()),
+    ('security_name', pa.string()),
+    ('security_type', pa.string()),
+    ('shares_held', pa.decimal128(20, 4)),
+    ('market_value_twd', pa.decimal128(20, 2)),
+    ('weight_pct', pa.decimal128(10, 4)),
+    ('source_url', pa.string()),
+    ('scraped_at', pa.timestamp('us')),
+])
+
+def _record_batch(rows: list) -> pa.RecordBatch:
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(col, type=field.type) for col, field in zip(columns, EXPORT_SCHEMA)],
+        schema=EXPORT_SCHEMA,
+    )
+
+def export_holdings(path: str, etf_symbol: Optional[str] = None, start_date: Optional[date] = None,
+                    end_date: Optional[date] = None, batch_size: int = 50_000,
+                    fmt: Optional[str] = None) -> int:
+    """
+    Stream etf_holdings to Parquet (one row group per batch) or Arrow IPC
+    through a server-side cursor, so memory stays at one batch however much
+    history is exported. Format follows the file extension unless fmt is given.
+    Returns the number of rows written.
+    """
+    fmt = fmt or ('arrow' if path.endswith(('.arrow', '.feather', '.ipc')) else 'parquet')
+    conditions, params = ['TRUE'], []
+    if etf_symbol:
+        conditions.append('etf_symbol = %s')
+        params.append(etf_symbol)
+    if start_date:
+        conditions.append('trade_date >= %s')
+        params.append(start_date)
+    if end_date:
+        conditions.append('trade_date <= %s')
+        params.append(end_date)
+    
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(path, EXPORT_SCHEMA, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(path, EXPORT_SCHEMA)
+    total = 0
+    try:
+        with db_connection() as conn:
+            # A named cursor keeps the result on the server; fetchmany pulls one batch at a time
+            with conn.cursor(name='etf_holdings_export') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(f'''
+                    SELECT {', '.join(EXPORT_SCHEMA.names)}
+                    FROM etf_holdings
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY etf_symbol, trade_date DESC, rank
+                ''', params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    writer.write_batch(_record_batch(rows))
+                    total += len(rows)
+    finally:
+        writer.close()
+    return total
 
 def query_etfs() -> pd.DataFrame:
     """List all tracked ETFs"""
-    conn = get_db_connection()
-    df = pd.read_sql_query('SELECT symbol, name, provider, type FROM etf_master', conn)
-    conn.close()
-    return df
+    with db_connection() as conn:
+        return pd.read_sql_query('SELECT symbol, name, provider, type FROM etf_master', conn)
 
 def query_scrape_log(etf_symbol: Optional[str] = None, days: int = 7) -> pd.DataFrame:
     """Get scrape history"""
-    conn = get_db_connection()
-    if etf_symbol:
-        df = pd.read_sql_query('''
+    with db_connection() as conn:
+        if etf_symbol:
+            return pd.read_sql_query('''
+                SELECT 
+                    scrape_date,
+                    etf_symbol,
+                    status,
+                    holdings_count,
+                    route,
+                    fetch_ms,
+                    bytes_downloaded,
+                    parse_ms,
+                    rows_saved,
+                    db_ms,
+                    error_message
+                FROM etf_scrape_log
+                WHERE etf_symbol = %s
+                ORDER BY scrape_date DESC, scrape_start DESC
+                LIMIT %s
+            ''', conn, params=(etf_symbol, days))
+        return pd.read_sql_query('''
             SELECT 
                 scrape_date,
                 etf_symbol,
                 status,
                 holdings_count,
+                route,
+                fetch_ms,
+                bytes_downloaded,
+                parse_ms,
+                rows_saved,
+                db_ms,
                 error_message
             FROM etf_scrape_log
-            WHERE etf_symbol = %s
-            ORDER BY scrape_date DESC
-            LIMIT %s
-        ''', conn, params=(etf_symbol, days))
-    else:
-        df = pd.read_sql_query('''
-            SELECT 
-                scrape_date,
-                etf_symbol,
-                status,
-                holdings_count,
-                error_message
-            FROM etf_scrape_log
-            ORDER BY scrape_date DESC
+            ORDER BY scrape_date DESC, scrape_start DESC
             LIMIT %s
         ''', conn, params=(days,))
-    conn.close()
-    return df
 
 def main():
     import sys
@@ -107,7 +303,9 @@ def main():
         print("  list                      - Show all tracked ETFs")
         print("  holdings <symbol> [days]  - Show holdings (default: 7 days)")
         print("  changes <symbol> [days]   - Show changes (default: 7 days)")
+        print("  history <symbol> [start] [end] - Page through full history (YYYY-MM-DD)")
         print("  log [symbol] [days]       - Show scrape log")
+        print("  export <file.parquet|file.arrow> [symbol] [start] [end] - Stream holdings to disk")
         return
     
     cmd = sys.argv[1]
@@ -137,6 +335,29 @@ def main():
         else:
             print(df.to_string(index=False))
     
+    elif cmd == 'history':
+        symbol = sys.argv[2] if len(sys.argv) > 2 else '00919'
+        start = date.fromisoformat(sys.argv[3]) if len(sys.argv) > 3 else None
+        end = date.fromisoformat(sys.argv[4]) if len(sys.argv) > 4 else None
+        print(f"\n📚 History for {symbol}:")
+        empty = True
+        for df in iter_holdings_pages(symbol, start_date=start, end_date=end):
+            print(df.to_string(index=False, header=empty))
+            empty = False
+        if empty:
+            print("No data found. Run scraper first!")
+    
+    elif cmd == 'export':
+        if len(sys.argv) < 3:
+            print("Usage: python query.py export <file.parquet|file.arrow> [symbol] [start] [end]")
+            return
+        path = sys.argv[2]
+        symbol = sys.argv[3] if len(sys.argv) > 3 and sys.argv[3] != 'all' else None
+        start = date.fromisoformat(sys.argv[4]) if len(sys.argv) > 4 else None
+        end = date.fromisoformat(sys.argv[5]) if len(sys.argv) > 5 else None
+        total = export_holdings(path, symbol, start, end)
+        print(f"\n💾 Exported {total} holdings to {path}")
+    
     elif cmd == 'log':
         symbol = sys.argv[2] if len(sys.argv) > 2 else None
         days = int(sys.argv[3]) if len(sys.argv) > 3 else 7
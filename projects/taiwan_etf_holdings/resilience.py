@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Fetch resilience: classified retries with jittered exponential backoff
+and per-key (ETF / host) circuit breakers
+"""
+
+import asyncio
+import random
+import time
+import logging
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 429 and 5xx are worth another try; 520/521 are Zyte's temporary download errors
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504, 520, 521}
+
+class FetchError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None,
+                 retry_after: Optional[float] = None, retryable: Optional[bool] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.retryable = status in RETRYABLE_STATUS if retryable is None else retryable
+
+class CircuitOpenError(FetchError):
+    def __init__(self, key: str, retry_in: float):
+        super().__init__(f"circuit open for {key} (retry in {retry_in:.0f}s)", retryable=False)
+        self.key = key
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds (delta-seconds or HTTP-date)"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    
+    @classmethod
+    def from_config(cls, config: dict) -> 'RetryPolicy':
+        return cls(**{k: v for k, v in (config or {}).items() if k in cls.__dataclass_fields__})
+    
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter backoff for the given (1-based) attempt, never sooner than Retry-After"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            return min(max(backoff, retry_after), self.max_delay)
+        return backoff
+
+@dataclass
+class _Circuit:
+    failures: int = 0
+    opened_at: Optional[float] = None
+    trial_in_flight: bool = False
+
+class CircuitBreakers:
+    """
+    One breaker per key. After failure_threshold consecutive failures a key
+    opens and fails fast; after reset_timeout a single trial call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 300):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._circuits: Dict[str, _Circuit] = {}
+    
+    @classmethod
+    def from_config(cls, config: dict) -> 'CircuitBreakers':
+        config = config or {}
+        return cls(config.get('failure_threshold', 5), config.get('reset_timeout', 300))
+    
+    def state(self, key: str) -> str:
+        circuit = self._circuits.get(key)
+        if circuit is None or circuit.opened_at is None:
+            return 'closed'
+        if time.monotonic() - circuit.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+    
+    def check(self, key: str) -> bool:
+        """Raise CircuitOpenError unless a call for key may proceed; True if it took the half-open trial"""
+        state = self.state(key)
+        if state == 'closed':
+            return False
+        circuit = self._circuits[key]
+        if state == 'half-open' and not circuit.trial_in_flight:
+            circuit.trial_in_flight = True
+            return True
+        retry_in = max(self.reset_timeout - (time.monotonic() - circuit.opened_at), 0)
+        raise CircuitOpenError(key, retry_in)
+    
+    def check_all(self, keys: Sequence[str]):
+        """check() every key; if one is open, give back the trials already taken before raising"""
+        reserved = []
+        try:
+            for key in keys:
+                if self.check(key):
+                    reserved.append(key)
+        except CircuitOpenError:
+            for key in reserved:
+                self.release(key)
+            raise
+    
+    def release(self, key: str):
+        circuit = self._circuits.get(key)
+        if circuit is not None:
+            circuit.trial_in_flight = False
+    
+    def record_success(self, key: str):
+        self._circuits.pop(key, None)
+    
+    def record_failure(self, key: str):
+        circuit = self._circuits.setdefault(key, _Circuit())
+        circuit.failures += 1
+        circuit.trial_in_flight = False
+        if circuit.failures >= self.failure_threshold or circuit.opened_at is not None:
+            if circuit.opened_at is None:
+                logger.warning(f"Circuit opened for {key} after {circuit.failures} failures")
+            circuit.opened_at = time.monotonic()
+
+async def call_with_retries(fn: Callable[..., Awaitable[Any]], *args,
+                            policy: RetryPolicy, breakers: CircuitBreakers,
+                            keys: Sequence[str] = (), host_keys: Sequence[str] = (),
+                            label: str = '') -> Any:
+    """
+    Await fn(*args), retrying retryable FetchErrors with backoff. Every key's
+    breaker must allow the attempt and records its outcome. host_keys are
+    shared by many ETFs, so only retryable (transport, 429, 5xx) failures
+    count against them: a 404 for one bad URL says nothing about the host.
+    Backoff sleeps happen here, outside whatever slot fn acquires.
+    """
+    keys = tuple(keys) + tuple(host_keys)
+    for attempt in range(1, policy.max_attempts + 1):
+        breakers.check_all(keys)
+        try:
+            result = await fn(*args)
+        except FetchError as e:
+            for key in keys:
+                if e.retryable or key not in host_keys:
+                    breakers.record_failure(key)
+                else:
+                    breakers.release(key)
+            if not e.retryable or attempt == policy.max_attempts:
+                raise
+            delay = policy.delay(attempt, e.retry_after)
+            logger.warning(f"{label}: {e} (attempt {attempt}/{policy.max_attempts}), "
+                           f"retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        except BaseException:
+            # Cancellation or a bug: release any half-open trial without judging the key
+            for key in keys:
+                breakers.release(key)
+            raise
+        else:
+            for key in keys:
+                breakers.record_success(key)
+            return result
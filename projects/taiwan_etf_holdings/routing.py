@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Cost-aware fetch routing
+Learns per URL (falling back to the provider's record for URLs not seen
+yet) whether a cheap direct fetch returns parseable holdings, so Zyte
+rendering is only paid for where it is actually needed.
+"""
+
+import json
+import os
+import threading
+import logging
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DIRECT = 'direct'
+ZYTE = 'zyte'
+ROUTES = (DIRECT, ZYTE)
+
+@dataclass
+class RouteStats:
+    attempts: int = 0
+    successes: int = 0
+    consecutive_failures: int = 0
+    latency_ms: float = 0.0          # exponentially weighted moving average
+    skipped: int = 0                 # plans that left this route out since it last ran
+    last_success: Optional[str] = None
+    
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.attempts if self.attempts else 0.0
+    
+    def record(self, ok: bool, latency_ms: Optional[float]):
+        """Count an outcome; latency_ms None when the fetch was timed elsewhere (queue parse stage)"""
+        self.attempts += 1
+        self.skipped = 0
+        if latency_ms is not None:
+            self.latency_ms = latency_ms if not self.latency_ms else 0.8 * self.latency_ms + 0.2 * latency_ms
+        if ok:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.last_success = datetime.now().isoformat(timespec='seconds')
+        else:
+            self.consecutive_failures += 1
+
+class FetchRouter:
+    """
+    Orders the routes to try for a page. Direct goes first unless it has
+    failed fail_threshold times in a row for this URL (or, for a new URL,
+    mostly fails across its provider); even then it is re-probed every
+    probe_every runs so a site that stops needing JS is noticed.
+    """
+    
+    def __init__(self, path: str = 'routes.json', fail_threshold: int = 2,
+                 probe_every: int = 10, min_provider_samples: int = 3):
+        self.path = path
+        self.fail_threshold = fail_threshold
+        self.probe_every = probe_every
+        self.min_provider_samples = min_provider_samples
+        self._lock = threading.Lock()
+        # {provider: {url: {route: RouteStats}}}
+        self._stats: Dict[str, Dict[str, Dict[str, RouteStats]]] = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._stats = {
+                    provider: {url: {route: RouteStats(**s) for route, s in routes.items()}
+                               for url, routes in urls.items()}
+                    for provider, urls in json.load(f).items()
+                }
+    
+    @classmethod
+    def from_config(cls, config: dict) -> 'FetchRouter':
+        routing = config.get('routing', {})
+        return cls(
+            routing.get('path', 'routes.json'),
+            routing.get('fail_threshold', 2),
+            routing.get('probe_every', 10),
+            routing.get('min_provider_samples', 3),
+        )
+    
+    def stats(self, provider: str, url: str, route: str) -> RouteStats:
+        with self._lock:
+            return self._stats.setdefault(provider, {}).setdefault(url, {}).setdefault(route, RouteStats())
+    
+    def provider_stats(self, provider: str, route: str) -> RouteStats:
+        """Aggregate of one route over every URL of a provider"""
+        total = RouteStats()
+        with self._lock:
+            for routes in self._stats.get(provider, {}).values():
+                s = routes.get(route)
+                if s is not None and s.attempts:
+                    total.latency_ms = (total.latency_ms * total.attempts + s.latency_ms * s.attempts) \
+                        / (total.attempts + s.attempts)
+                    total.attempts += s.attempts
+                    total.successes += s.successes
+        return total
+    
+    def _direct_useless(self, provider: str, url: str, direct: RouteStats) -> bool:
+        if direct.attempts:
+            return direct.consecutive_failures >= self.fail_threshold
+        prior = self.provider_stats(provider, DIRECT)
+        return prior.attempts >= self.min_provider_samples and prior.success_rate < 0.5
+    
+    def plan(self, provider: str, url: str, available: List[str]) -> List[str]:
+        """Routes to try in order, restricted to the available ones"""
+        if DIRECT not in available or ZYTE not in available:
+            return [r for r in ROUTES if r in available]
+        direct = self.stats(provider, url, DIRECT)
+        if self._direct_useless(provider, url, direct):
+            if direct.skipped + 1 < self.probe_every:
+                with self._lock:
+                    direct.skipped += 1
+                return [ZYTE]
+            logger.info(f"Re-probing direct fetch for {url}")
+        return [DIRECT, ZYTE]
+    
+    def record(self, provider: str, url: str, route: str, ok: bool, latency_ms: Optional[float]):
+        stats = self.stats(provider, url, route)
+        with self._lock:
+            stats.record(ok, latency_ms)
+    
+    def summary(self) -> Dict[str, Dict[str, RouteStats]]:
+        """Per-provider, per-route totals for the run report"""
+        with self._lock:
+            providers = list(self._stats)
+        return {
+            provider: {route: stats for route in ROUTES
+                       if (stats := self.provider_stats(provider, route)).attempts}
+            for provider in providers
+        }
+    
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {provider: {url: {route: asdict(s) for route, s in routes.items()}
+                               for url, routes in urls.items()}
+                    for provider, urls in self._stats.items()}
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Per-ETF scrape timings for etf_scrape_log
+The scraper opens a UnitTiming per page URL when it starts on an ETF (or
+ETF/date), and fetch, parse and save add their time to it as the page
+moves through the pipeline. Finished units are written with one batched
+INSERT per run; `query.py log` reads the columns back.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+from psycopg2.extras import execute_values
+
+from metrics import UNITS
+
+logger = logging.getLogger(__name__)
+
+LOG_COLUMNS = (
+    'etf_symbol', 'trade_date', 'run_type', 'node_id', 'scrape_date', 'scrape_start', 'scrape_end',
+    'status', 'error_message', 'pages_scraped', 'holdings_count',
+    'route', 'fetch_ms', 'bytes_downloaded', 'parse_ms', 'rows_saved', 'db_ms',
+)
+
+@dataclass
+class UnitTiming:
+    etf_symbol: str
+    trade_date: date
+    started: datetime = field(default_factory=datetime.now)
+    ended: Optional[datetime] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
+    route: Optional[str] = None
+    fetches: int = 0
+    fetch_ms: float = 0.0
+    bytes_downloaded: int = 0
+    parse_ms: float = 0.0
+    holdings_count: int = 0
+    rows_saved: int = 0
+    db_ms: float = 0.0
+    
+    def finish(self, status: str, error: Optional[str] = None) -> 'UnitTiming':
+        self.status = status
+        self.error = error[:1000] if error else None
+        self.ended = datetime.now()
+        return self
+    
+    def values(self, run_type: str, node_id: Optional[str]) -> tuple:
+        """Row for LOG_COLUMNS"""
+        return (
+            self.etf_symbol, self.trade_date, run_type, node_id, date.today(), self.started,
+            self.ended or datetime.now(), self.status or 'failed', self.error, self.fetches,
+            self.holdings_count, self.route, round(self.fetch_ms, 1), self.bytes_downloaded,
+            round(self.parse_ms, 1), self.rows_saved, round(self.db_ms, 1),
+        )
+
+def write_log(cursor, timings: Iterable[UnitTiming], run_type: str = 'daily',
+              node_id: Optional[str] = None) -> int:
+    """Insert finished units into etf_scrape_log in one statement (runs in the caller's transaction)"""
+    timings = list(timings)
+    if timings:
+        execute_values(cursor, f"INSERT INTO etf_scrape_log ({', '.join(LOG_COLUMNS)}) VALUES %s",
+                       [t.values(run_type, node_id) for t in timings])
+        for t in timings:
+            UNITS.inc(status=t.status or 'failed')
+    return len(timings)
+
+class RunLog:
+    """Timings of in-flight units, keyed by page URL"""
+    
+    def __init__(self):
+        self._units: Dict[str, UnitTiming] = {}
+    
+    def start(self, url: str, etf_symbol: str, trade_date: date) -> UnitTiming:
+        timing = self._units[url] = UnitTiming(etf_symbol, trade_date)
+        return timing
+    
+    def get(self, url: str) -> Optional[UnitTiming]:
+        return self._units.get(url)
+    
+    def finish(self, url: str, status: str, error: Optional[str] = None,
+               etf_symbol: Optional[str] = None, trade_date: Optional[date] = None) -> UnitTiming:
+        """Take a unit out of the log, marked with its outcome (created bare if it was never started)"""
+        timing = self._units.pop(url, None) or UnitTiming(etf_symbol, trade_date or date.today())
+        return timing.finish(status, error or timing.error)
+    
+    def take(self, urls: Iterable[str]) -> List[UnitTiming]:
+        """Finished units among urls; any still open never reached the database and count as failed"""
+        taken = []
+        for url in urls:
+            timing = self._units.pop(url, None)
+            if timing is not None:
+                taken.append(timing if timing.status else timing.finish('failed', 'not saved'))
+        return taken
+
+def report(timings: List[UnitTiming]):
+    """Log where the run's time went"""
+    if not timings:
+        return
+    for t in sorted(timings, key=lambda t: t.fetch_ms + t.parse_ms + t.db_ms, reverse=True):
+        logger.info(f"{t.etf_symbol}@{t.trade_date}: {t.status}, fetch {t.fetch_ms:.0f} ms "
+                    f"({t.fetches}x {t.route or '-'}, {t.bytes_downloaded / 1024:.0f} KiB), "
+                    f"parse {t.parse_ms:.0f} ms, db {t.db_ms:.0f} ms, {t.rows_saved} rows written")
+    logger.info(f"Run totals over {len(timings)} ETFs: fetch {sum(t.fetch_ms for t in timings) / 1000:.1f}s, "
+                f"parse {sum(t.parse_ms for t in timings) / 1000:.1f}s, "
+                f"db {sum(t.db_ms for t in timings) / 1000:.1f}s, "
+                f"{sum(t.bytes_downloaded for t in timings) / 1048576:.1f} MiB downloaded")
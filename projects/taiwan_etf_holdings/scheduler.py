@@ -5,15 +5,24 @@ Uses APScheduler for robust scheduling with retry logic
 """
 
 import asyncio
+import time
 import yaml
 import logging
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.base import BaseTrigger
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
 import pytz
 
-from scraper import PostgresETFScraper
+import metrics
+from coordination import Coordinator
+from job_queue import JobQueue, QueueWorker
+from loop_monitor import LoopMonitor
+from scraper import ETFScraper
+from trading_calendar import DEFAULT_PATH, load_calendar
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,12 +30,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class TradingDayTrigger(BaseTrigger):
+    """A cron time of day that only fires on TWSE trading days"""
+    
+    def __init__(self, cron: CronTrigger, calendar_path: str = DEFAULT_PATH):
+        self.cron = cron
+        self.calendar_path = calendar_path
+    
+    def get_next_fire_time(self, previous_fire_time, now):
+        # Re-read through the cache each time so an updated holiday file applies without a restart
+        calendar = load_calendar(self.calendar_path)
+        fire = self.cron.get_next_fire_time(previous_fire_time, now)
+        while fire is not None and not calendar.is_trading_day(fire.date()):
+            fire = self.cron.get_next_fire_time(fire, fire + timedelta(seconds=1))
+        return fire
+    
+    def __str__(self):
+        return f"trading days, {self.cron}"
+
 class ETFScheduler:
     def __init__(self, config_path: str = "config.yaml"):
         self.config_path = config_path
         self.config = self._load_config()
         self.scheduler = AsyncIOScheduler(timezone=pytz.timezone('Asia/Taipei'))
+        self.coordinator = None
         self.scraper = None
+        self.drain_task = None
+        self.metrics_runner = None
+        self.metrics_task = None
+        self.lag_probe = None
+        # Owned here so metrics can start without building the scraper; shared with it once built
+        self.loop_monitor = LoopMonitor.from_config(self.config)
         
     def _load_config(self) -> dict:
         with open(self.config_path) as f:
@@ -36,19 +70,135 @@ class ETFScheduler:
         """Listen for job events"""
         if event.exception:
             logger.error(f"Job {event.job_id} failed: {event.exception}")
+            metrics.JOB_RUNS.inc(job=event.job_id, outcome='failed')
         else:
             logger.info(f"Job {event.job_id} executed successfully")
+            metrics.JOB_RUNS.inc(job=event.job_id, outcome='success')
+            metrics.JOB_LAST_SUCCESS.set(time.time(), job=event.job_id)
     
-    async def run_scraper(self):
-        """Execute the scraper job"""
-        logger.info("Starting scheduled scrape...")
+    async def start_metrics(self):
+        """Serve /metrics and sample event-loop lag for as long as the daemon runs"""
+        metrics_config = self.config.get('metrics', {})
+        self.metrics_runner = await metrics.start_server(metrics_config.get('host', '0.0.0.0'),
+                                                         metrics_config.get('port', 9108))
+        if self.loop_monitor is not None:
+            # The loop monitor samples lag into the same metrics; keep it the only source
+            self.loop_monitor.start()
+        else:
+            self.lag_probe = asyncio.ensure_future(metrics.probe_loop_lag(metrics_config.get('lag_interval', 0.5)))
+        metrics.QUEUE_DEPTH.set_function(
+            lambda: self.scraper.fetch_scheduler.waiting if self.scraper else 0, queue='fetch_slots')
+        metrics.QUEUE_DEPTH.set_function(
+            lambda: self.scraper.save_queue_depth() if self.scraper else 0, queue='save')
+        metrics.FETCHES_IN_FLIGHT.set_function(
+            lambda: self.scraper.fetch_scheduler.in_flight if self.scraper else 0)
+    
+    def _metrics_started(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Metrics not started: {task.exception()!r}", exc_info=task.exception())
+    
+    def job_units(self) -> List[Tuple[str, List[str]]]:
+        """(unit name, ETF symbols) per schedulable unit: one per provider, or one per ETF"""
+        group_by = self.config.get('schedule', {}).get('group_by', 'provider')
+        units: Dict[str, List[str]] = {}
+        for etf in self.config['etfs']:
+            unit = etf['symbol'] if group_by == 'etf' else etf['provider']
+            units.setdefault(unit, []).append(etf['symbol'])
+        return list(units.items())
+    
+    async def get_scraper(self) -> ETFScraper:
+        """One long-lived scraper shared by all units (session, process pool, rate limits)"""
+        if self.scraper is None:
+            scraper = ETFScraper(self.config_path)
+            if self.loop_monitor is not None:
+                scraper.loop_monitor = self.loop_monitor
+            await scraper.open_session()
+            scraper.open_parse_pool()
+            self.scraper = scraper
+            # Multi-node mode: units are claimed through Postgres advisory locks
+            self.coordinator = Coordinator.from_config(self.config, scraper._get_db_connection)
+        return self.scraper
+    
+    async def close_scraper(self):
+        if self.scraper is not None:
+            await self.scraper.close_session()
+            self.scraper.close_parse_pool()
+            self.scraper = None
+    
+    async def drain_queue(self):
+        """Work the job queue until empty; units enqueued meanwhile join the running drain"""
+        if self.drain_task is None or self.drain_task.done():
+            scraper = await self.get_scraper()
+            queue_config = self.config.get('job_queue', {})
+            worker = QueueWorker(scraper, JobQueue.from_config(self.config),
+                                 concurrency=queue_config.get('concurrency', 4))
+            self.drain_task = asyncio.ensure_future(worker.run(until_idle=True))
+        await asyncio.shield(self.drain_task)
+    
+    async def enqueue_unit(self, unit: str, symbols: List[str]):
+        """Queue mode: add today's units to etf_scrape_jobs and drain; retries happen inside the queue"""
+        scraper = await self.get_scraper()
+        queue = JobQueue.from_config(self.config)
+        conn = await asyncio.to_thread(scraper._get_db_connection)
         try:
-            self.scraper = PostgresETFScraper(self.config_path)
-            await self.scraper.run()
-            logger.info("Scheduled scrape completed")
+            added = await asyncio.to_thread(queue.enqueue, conn,
+                                           [(s, date.today()) for s in symbols], 'daily')
+        finally:
+            conn.close()
+        logger.info(f"Queued {added} units for {unit}")
+        await self.drain_queue()
+    
+    async def run_unit(self, unit: str, symbols: List[str], attempt: int = 1):
+        """Scrape one unit; ETFs that failed get a retry job of their own"""
+        schedule_config = self.config.get('schedule', {})
+        if schedule_config.get('mode') == 'queue':
+            return await self.enqueue_unit(unit, symbols)
+        retries = schedule_config.get('retries', 2)
+        logger.info(f"Starting scrape of {unit} (attempt {attempt}): {', '.join(symbols)}")
+        try:
+            scraper = await self.get_scraper()
+            counts = await scraper.run([e for e in scraper.etfs if e.symbol in symbols], self.coordinator)
+            failed = [symbol for symbol in symbols if counts.get(symbol, 0) is None]
         except Exception as e:
-            logger.error(f"Scheduled scrape failed: {e}")
-            raise
+            logger.error(f"Scrape of {unit} failed: {e}")
+            failed = symbols
+        if not failed:
+            logger.info(f"Scrape of {unit} completed")
+            return
+        if attempt > retries:
+            raise RuntimeError(f"{unit}: {', '.join(failed)} still failing after {attempt} attempts")
+        
+        delay = schedule_config.get('retry_delay', 300)
+        if not self.scheduler.running:
+            # --once: no scheduler to hand the retry to
+            logger.warning(f"{unit}: retrying {', '.join(failed)} in {delay}s")
+            await asyncio.sleep(delay)
+            return await self.run_unit(unit, failed, attempt + 1)
+        
+        run_at = datetime.now(self.scheduler.timezone) + timedelta(seconds=delay)
+        self.scheduler.add_job(
+            self.run_unit, DateTrigger(run_date=run_at),
+            args=[unit, failed, attempt + 1],
+            id=f'etf_scrape_{unit}_retry',
+            name=f'Retry ETF scrape ({unit})',
+            replace_existing=True,
+        )
+        logger.warning(f"{unit}: retrying {', '.join(failed)} at {run_at:%H:%M:%S}")
+    
+    async def run_scraper(self):
+        """Scrape every unit now, concurrently (used by --once)"""
+        logger.info("Starting scrape...")
+        try:
+            results = await asyncio.gather(
+                *(self.run_unit(unit, symbols) for unit, symbols in self.job_units()),
+                return_exceptions=True,
+            )
+        finally:
+            await self.close_scraper()
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+        logger.info("Scrape completed")
     
     def start(self):
         """Start the scheduler"""
@@ -62,15 +212,31 @@ class ETFScheduler:
             h, m = time_part.split(':')
             hour, minute = int(h), int(m)
         
-        # Add job
-        self.scheduler.add_job(
-            self.run_scraper,
-            CronTrigger(hour=hour, minute=minute, timezone='Asia/Taipei'),
-            id='etf_daily_scrape',
-            name='Daily ETF Holdings Scrape',
-            replace_existing=True,
-            max_instances=1
-        )
+        # One job per unit, each starting stagger_seconds after the previous one
+        stagger = schedule_config.get('stagger_seconds', 120)
+        calendar_path = self.config.get('calendar', {}).get('path', DEFAULT_PATH)
+        base = datetime(2000, 1, 1, hour, minute)
+        for i, (unit, symbols) in enumerate(self.job_units()):
+            at = base + timedelta(seconds=i * stagger)
+            self.scheduler.add_job(
+                self.run_unit,
+                TradingDayTrigger(
+                    CronTrigger(hour=at.hour, minute=at.minute, second=at.second, timezone='Asia/Taipei'),
+                    calendar_path,
+                ),
+                args=[unit, symbols],
+                id=f'etf_scrape_{unit}',
+                name=f'Daily ETF Holdings Scrape ({unit})',
+                replace_existing=True,
+                max_instances=schedule_config.get('max_instances', 1),
+                coalesce=True,
+            )
+            logger.info(f"Scheduled {unit} ({len(symbols)} ETFs) at {at:%H:%M:%S} Asia/Taipei")
+        
+        if self.config.get('metrics', {}).get('enabled', True):
+            # Runs once the daemon's event loop starts
+            self.metrics_task = asyncio.get_event_loop().create_task(self.start_metrics())
+            self.metrics_task.add_done_callback(self._metrics_started)
         
         # Add event listener
         self.scheduler.add_listener(
@@ -79,7 +245,7 @@ class ETFScheduler:
         )
         
         self.scheduler.start()
-        logger.info(f"Scheduler started. Next scrape at {hour:02d}:{minute:02d} Asia/Taipei")
+        logger.info(f"Scheduler started. First scrape at {hour:02d}:{minute:02d} Asia/Taipei")
         
         return self.scheduler
     
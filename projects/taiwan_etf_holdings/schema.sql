@@ -1,13 +1,10 @@
 -- PostgreSQL Schema for Taiwan ETF Holdings Tracker
 
--- Drop existing tables if needed
-DROP TABLE IF EXISTS etf_scrape_log CASCADE;
-DROP TABLE IF EXISTS etf_holding_changes CASCADE;
-DROP TABLE IF EXISTS etf_holdings CASCADE;
-DROP TABLE IF EXISTS etf_master CASCADE;
+-- Safe to re-apply: the scraper runs this on every start, so history is kept.
+-- To reset a database, drop the tables by hand or re-run setup_postgres.sh.
 
 -- ETF Master Table
-CREATE TABLE etf_master (
+CREATE TABLE IF NOT EXISTS etf_master (
     symbol VARCHAR(10) PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
     provider VARCHAR(50),
@@ -19,7 +16,7 @@ CREATE TABLE etf_master (
 );
 
 -- Holdings Table (daily snapshot)
-CREATE TABLE etf_holdings (
+CREATE TABLE IF NOT EXISTS etf_holdings (
     id BIGSERIAL PRIMARY KEY,
     etf_symbol VARCHAR(10) NOT NULL REFERENCES etf_master(symbol) ON DELETE CASCADE,
     trade_date DATE NOT NULL,
@@ -40,10 +37,13 @@ CREATE TABLE etf_holdings (
 );
 
 -- Holdings Changes Tracking
-CREATE TABLE etf_holding_changes (
+CREATE TABLE IF NOT EXISTS etf_holding_changes (
     id BIGSERIAL PRIMARY KEY,
     etf_symbol VARCHAR(10) NOT NULL REFERENCES etf_master(symbol) ON DELETE CASCADE,
     trade_date DATE NOT NULL,
+    previous_trade_date DATE,
+    isin VARCHAR(12),
+    security_name VARCHAR(255),
     previous_weight DECIMAL(10, 4),
     current_weight DECIMAL(10, 4),
     weight_change DECIMAL(10, 4),
@@ -55,7 +55,7 @@ CREATE TABLE etf_holding_changes (
 );
 
 -- Scrape History
-CREATE TABLE etf_scrape_log (
+CREATE TABLE IF NOT EXISTS etf_scrape_log (
     id BIGSERIAL PRIMARY KEY,
     etf_symbol VARCHAR(10) NOT NULL REFERENCES etf_master(symbol) ON DELETE CASCADE,
     scrape_date DATE NOT NULL,
@@ -68,14 +68,70 @@ CREATE TABLE etf_scrape_log (
     zyte_request_id VARCHAR(100)
 );
 
+-- Durable scrape pipeline (job_queue.py): one row per (ETF, trade date) unit
+-- moving through fetch -> parse -> save -> diff -> done (or failed)
+CREATE TABLE IF NOT EXISTS etf_scrape_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    etf_symbol VARCHAR(10) NOT NULL REFERENCES etf_master(symbol) ON DELETE CASCADE,
+    trade_date DATE NOT NULL,
+    run_type VARCHAR(20) NOT NULL DEFAULT 'daily', -- daily (live page) | backfill (history_url)
+    stage VARCHAR(10) NOT NULL DEFAULT 'fetch',
+    status VARCHAR(10) NOT NULL DEFAULT 'ready',   -- ready | running
+    route VARCHAR(10),                             -- fetch route to try (routing.py), NULL = router's choice
+    attempts INTEGER NOT NULL DEFAULT 0,           -- attempts at the current stage
+    run_after TIMESTAMP NOT NULL DEFAULT NOW(),
+    locked_by VARCHAR(100),
+    locked_at TIMESTAMP,
+    page_sha256 CHAR(64),                          -- fetch output, body in etf_scrape_pages
+    holdings BYTEA,                                -- parse output (parse_cache encoding)
+    holdings_count INTEGER,
+    stage_ms JSONB NOT NULL DEFAULT '{}',          -- milliseconds spent per stage
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE(etf_symbol, trade_date)
+);
+
+-- Raw pages handed from the fetch stage to the parse stage (zlib-compressed)
+CREATE TABLE IF NOT EXISTS etf_scrape_pages (
+    sha256 CHAR(64) PRIMARY KEY,
+    body BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Columns added after the first release
+ALTER TABLE etf_holding_changes ADD COLUMN IF NOT EXISTS previous_trade_date DATE;
+ALTER TABLE etf_holding_changes ADD COLUMN IF NOT EXISTS isin VARCHAR(12);
+ALTER TABLE etf_holding_changes ADD COLUMN IF NOT EXISTS security_name VARCHAR(255);
+-- Per-unit outcomes: backfill checkpoints (run_type 'backfill') and multi-node daily claims
+ALTER TABLE etf_scrape_log ADD COLUMN IF NOT EXISTS run_type VARCHAR(20) DEFAULT 'daily';
+ALTER TABLE etf_scrape_log ADD COLUMN IF NOT EXISTS trade_date DATE;
+ALTER TABLE etf_scrape_log ADD COLUMN IF NOT EXISTS node_id VARCHAR(100);
+-- Per-ETF timings (run_log.py), so `query.py log` shows where a run's time went
+ALTER TABLE etf_scrape_log ADD COLUMN IF NOT EXISTS route VARCHAR(10);
+ALTER TABLE etf_scrape_log ADD COLUMN IF NOT EXISTS fetch_ms REAL;          -- network time over all attempts
+ALTER TABLE etf_scrape_log ADD COLUMN IF NOT EXISTS bytes_downloaded BIGINT;
+ALTER TABLE etf_scrape_log ADD COLUMN IF NOT EXISTS parse_ms REAL;
+ALTER TABLE etf_scrape_log ADD COLUMN IF NOT EXISTS rows_saved INTEGER;     -- holdings rows inserted/updated/deleted
+ALTER TABLE etf_scrape_log ADD COLUMN IF NOT EXISTS db_ms REAL;             -- share of the batched save
+
 -- Indexes
-CREATE INDEX idx_holdings_etf_date ON etf_holdings(etf_symbol, trade_date DESC);
-CREATE INDEX idx_holdings_date ON etf_holdings(trade_date DESC);
-CREATE INDEX idx_holdings_isin ON etf_holdings(isin);
-CREATE INDEX idx_changes_etf_date ON etf_holding_changes(etf_symbol, trade_date DESC);
-CREATE INDEX idx_scrape_log ON etf_scrape_log(etf_symbol, scrape_date DESC);
+-- (etf_symbol, trade_date DESC, rank NULLS LAST, id) serves date windows and
+-- keyset pages; it supersedes the original idx_holdings_etf_date on
+-- (etf_symbol, trade_date DESC)
+DROP INDEX IF EXISTS idx_holdings_etf_date;
+CREATE INDEX IF NOT EXISTS idx_holdings_etf_date_rank ON etf_holdings(etf_symbol, trade_date DESC, rank NULLS LAST, id);
+CREATE INDEX IF NOT EXISTS idx_holdings_date ON etf_holdings(trade_date DESC);
+CREATE INDEX IF NOT EXISTS idx_holdings_isin ON etf_holdings(isin);
+CREATE INDEX IF NOT EXISTS idx_changes_etf_date ON etf_holding_changes(etf_symbol, trade_date DESC);
+CREATE INDEX IF NOT EXISTS idx_scrape_log ON etf_scrape_log(etf_symbol, scrape_date DESC);
+-- (etf_symbol, trade_date, run_type) serves backfill checkpoints and multi-node claims
+CREATE INDEX IF NOT EXISTS idx_scrape_log_unit ON etf_scrape_log(etf_symbol, trade_date, run_type);
+CREATE INDEX IF NOT EXISTS idx_scrape_jobs_ready ON etf_scrape_jobs(stage, run_after)
+    WHERE stage NOT IN ('done', 'failed');
 
 COMMENT ON TABLE etf_master IS 'Master table for tracked ETFs';
 COMMENT ON TABLE etf_holdings IS 'Daily holdings snapshots';
 COMMENT ON TABLE etf_holding_changes IS 'Change detection log';
 COMMENT ON TABLE etf_scrape_log IS 'Scraping operation history';
+COMMENT ON TABLE etf_scrape_jobs IS 'Durable fetch/parse/save/diff pipeline units';
@@ -6,18 +6,37 @@ Uses Zyte API for JavaScript rendering
 
 import asyncio
 import aiohttp
+import contextlib
+from collections import deque
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import json
+import time
 import yaml
-import base64
 import logging
+from dataclasses import dataclass, field, replace
 from datetime import datetime, date
-from typing import List, Dict, Optional
-from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
 import psycopg2
-from bs4 import BeautifulSoup
 import os
 from dotenv import load_dotenv
 
+import metrics
+from bulk_load import LoadStats, bulk_load_holdings
+from coordination import CLAIMED, DONE, Claim, Coordinator
+from fetch_scheduler import FetchScheduler
+from loop_monitor import LoopMonitor
+from models import ETFConfig, HoldingBatch
+from page_store import PageStore
+from parse_cache import ParseCache
+from parsers import get_parser, parse_page
+from routing import DIRECT, ZYTE, FetchRouter
+from run_log import RunLog, UnitTiming, report, write_log
+from resilience import CircuitBreakers, FetchError, RetryPolicy, call_with_retries, parse_retry_after
+from zyte_stream import ZyteResponseDecoder
+
 # Load environment variables from .env file
 load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
 
@@ -25,80 +44,108 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @dataclass
-class ETFConfig:
-    symbol: str
-    name: str
-    provider: str
-    type: str
-    url: str
-
-@dataclass
-class Holding:
-    etf_symbol: str
-    trade_date: date
-    holding_date: date
-    rank: int
-    isin: Optional[str]
-    issuer_name: str
-    security_name: str
-    security_type: str
-    shares_held: float
-    market_value_twd: float
-    weight_pct: float
-    source_url: str
+class FetchResult:
+    """Raw page as returned by the target site (status 304 = not modified)"""
+    status: int
+    body: Union[bytes, bytearray] = b''
+    headers: Dict[str, str] = field(default_factory=dict)
+    
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+    
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get('etag')
+    
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get('last-modified')
+    
+    @property
+    def text(self) -> str:
+        return self.body.decode('utf-8', errors='ignore')
 
 class ZyteClient:
     """Zyte API client for JavaScript rendering"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, session: Optional[aiohttp.ClientSession] = None):
         self.api_key = api_key or os.getenv('ZYTE_API_KEY', '')
         self.api_url = 'https://api.zyte.com/v1/extract'
+        self.session = session
+        self.timeout = 120
+        self.chunk_size = 64 * 1024
         
     async def fetch(self, url: str) -> Optional[str]:
         """Fetch page via Zyte API - returns HTML or None if fails"""
-        if not self.api_key:
-            logger.warning("No Zyte API key configured")
+        try:
+            result = await self.fetch_result(url)
+        except FetchError as e:
+            logger.error(f"Zyte fetch error: {e}")
             return None
+        return None if result.not_modified else result.text
+    
+    async def fetch_result(self, url: str, request_headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        """Fetch page via Zyte API, passing conditional headers through to the site; raises FetchError"""
+        if not self.api_key:
+            raise FetchError("No Zyte API key configured", retryable=False)
             
         try:
-            async with aiohttp.ClientSession() as session:
-                payload = {
-                    "url": url,
-                    "httpResponseBody": True,
-                }
+            payload = {
+                "url": url,
+                "httpResponseBody": True,
+                "httpResponseHeaders": True,
+            }
+            if request_headers:
+                payload["customHttpRequestHeaders"] = [
+                    {"name": k, "value": v} for k, v in request_headers.items()
+                ]
+            
+            # Zyte uses HTTP Basic Auth with api_key as username and empty password
+            async with self.session.post(
+                self.api_url,
+                json=payload,
+                auth=aiohttp.BasicAuth(self.api_key, ''),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            ) as resp:
                 
-                # Zyte uses HTTP Basic Auth with api_key as username and empty password
-                async with session.post(
-                    self.api_url,
-                    json=payload,
-                    auth=aiohttp.BasicAuth(self.api_key, '')
-                ) as resp:
-                    
-                    if resp.status != 200:
-                        error_text = await resp.text()
-                        logger.error(f"Zyte API error {resp.status}: {error_text[:200]}")
-                        return None
-                    
-                    data = await resp.json()
-                    
-                    # Decode base64 HTML response
-                    html_b64 = data.get("httpResponseBody")
-                    if html_b64:
-                        html = base64.b64decode(html_b64).decode('utf-8', errors='ignore')
-                        logger.info(f"Successfully fetched {len(html)} chars from Zyte")
-                        return html
-                    
-                    logger.warning("No httpResponseBody in Zyte response")
-                    return None
-                    
-        except Exception as e:
-            logger.error(f"Zyte fetch error: {e}")
-        return None
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise FetchError(f"Zyte API error {resp.status}: {error_text[:200]}", resp.status,
+                                     parse_retry_after(resp.headers.get('Retry-After')))
+                
+                # Decode the body as it streams in rather than holding the JSON text,
+                # the base64 string and the decoded page all at once
+                decoder = ZyteResponseDecoder()
+                async for chunk in resp.content.iter_chunked(self.chunk_size):
+                    metrics.ZYTE_BYTES.inc(len(chunk))
+                    decoder.feed(chunk)
+                data = decoder.finish()
+                metrics.ZYTE_BILLABLE.inc()
+                headers = {h['name'].lower(): h['value'] for h in data.get("httpResponseHeaders") or []}
+                status = data.get("statusCode", 200)
+                if status == 304:
+                    return FetchResult(status, headers=headers)
+                if status >= 400:
+                    raise FetchError(f"HTTP {status} for {url} (via Zyte)", status,
+                                     parse_retry_after(headers.get('retry-after')))
+                
+                if decoder.body:
+                    logger.info(f"Successfully fetched {len(decoder.body)} bytes from Zyte")
+                    return FetchResult(status, decoder.body, headers)
+                
+                raise FetchError("No httpResponseBody in Zyte response", retryable=False)
+                
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise FetchError(f"Zyte request failed: {e!r}", retryable=True) from e
+        except ValueError as e:
+            raise FetchError(f"Malformed Zyte response: {e}", retryable=True) from e
 
 class DirectClient:
     """Direct HTTP client"""
     
-    def __init__(self):
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        self.session = session
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
@@ -107,14 +154,25 @@ class DirectClient:
         
     async def fetch(self, url: str) -> Optional[str]:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=self.headers, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-                    if resp.status == 200:
-                        return await resp.text()
-                    logger.warning(f"HTTP {resp.status} for {url}")
-        except Exception as e:
+            result = await self.fetch_result(url)
+        except FetchError as e:
             logger.error(f"HTTP fetch error: {e}")
-        return None
+            return None
+        return None if result.not_modified else result.text
+    
+    async def fetch_result(self, url: str, request_headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        try:
+            headers = {**self.headers, **(request_headers or {})}
+            async with self.session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+                resp_headers = {k.lower(): v for k, v in resp.headers.items()}
+                if resp.status == 304:
+                    return FetchResult(304, headers=resp_headers)
+                if resp.status == 200:
+                    return FetchResult(200, await resp.read(), resp_headers)
+                raise FetchError(f"HTTP {resp.status} for {url}", resp.status,
+                                 parse_retry_after(resp_headers.get('retry-after')))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise FetchError(f"HTTP request failed: {e!r}", retryable=True) from e
 
 class ETFScraper:
     def __init__(self, config_path: str = "config.yaml"):
@@ -126,6 +184,86 @@ class ETFScraper:
         zyte_key = os.getenv('ZYTE_API_KEY', '')
         self.zyte = ZyteClient(zyte_key)
         self.direct = DirectClient()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.fetch_scheduler = FetchScheduler.from_config(self.config)
+        scraping_config = self.config.get('scraping', {})
+        self.retry_policy = RetryPolicy.from_config(scraping_config.get('retry', {}))
+        self.breakers = CircuitBreakers.from_config(scraping_config.get('circuit_breaker', {}))
+        self.parse_pool: Optional[ProcessPoolExecutor] = None
+        store_config = self.config.get('page_store', {})
+        self.page_store = PageStore(store_config.get('path', 'pages'), store_config.get('max_age_days')) \
+            if store_config.get('enabled', True) else None
+        self._page_hashes: Dict[str, str] = {}     # page URL -> SHA-256 of the body being parsed
+        self.router = FetchRouter.from_config(self.config)
+        self._fetch_ms: Dict[str, float] = {}      # page URL -> latency of its last fetch attempt
+        self.run_log = RunLog()                    # page URL -> timings of the unit fetching it
+        self._save_queues: List[asyncio.Queue] = []   # one per running save worker
+        self.loop_monitor = LoopMonitor.from_config(self.config)
+        cache_config = self.config.get('parse_cache', {})
+        self.parse_cache = ParseCache(
+            cache_config.get('path', 'parse_cache.sqlite'),
+            int(cache_config.get('max_mb', 256)) * 1024 * 1024,
+        ) if cache_config.get('enabled', True) else None
+        
+    async def __aenter__(self):
+        await self.open_session()
+        self.open_parse_pool()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close_session()
+        self.close_parse_pool()
+    
+    def monitor_loop(self) -> float:
+        """Attach the optional loop monitor to the running loop; returns a mark for loop_report"""
+        if self.loop_monitor is None:
+            return 0.0
+        self.loop_monitor.start()
+        return self.loop_monitor.mark()
+    
+    def loop_report(self, since: float):
+        """Log event-loop lag and the calls that blocked it since a monitor_loop mark"""
+        if self.loop_monitor is not None:
+            self.loop_monitor.log_report(since)
+    
+    def open_parse_pool(self):
+        """Process pool for CPU-bound parsing (scraping.parse_workers; 0 parses on the event loop)"""
+        workers = self.config.get('scraping', {}).get('parse_workers', os.cpu_count() or 1)
+        if workers and self.parse_pool is None:
+            # spawn: never fork a process that has a live event loop and sockets
+            self.parse_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+            )
+    
+    def close_parse_pool(self):
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=True, cancel_futures=True)
+        self.parse_pool = None
+    
+    def _create_session(self) -> aiohttp.ClientSession:
+        """Build one keep-alive session with pooled, DNS-cached connections"""
+        http_config = self.config.get('http', {})
+        connector = aiohttp.TCPConnector(
+            limit=http_config.get('connection_limit', 100),
+            limit_per_host=http_config.get('limit_per_host', 10),
+            ttl_dns_cache=http_config.get('dns_cache_ttl', 300),
+            keepalive_timeout=http_config.get('keepalive_timeout', 30),
+        )
+        return aiohttp.ClientSession(connector=connector)
+    
+    async def open_session(self):
+        """Open the shared HTTP session and hand it to both clients"""
+        if self.session is None or self.session.closed:
+            self.session = self._create_session()
+            self.zyte.session = self.session
+            self.direct.session = self.session
+    
+    async def close_session(self):
+        if self.session is not None:
+            await self.session.close()
+        self.session = None
+        self.zyte.session = None
+        self.direct.session = None
         
     def _load_config(self) -> dict:
         with open(self.config_path) as f:
@@ -162,78 +300,363 @@ class ETFScraper:
         conn.close()
         logger.info(f"DB ready with {len(self.etfs)} ETFs")
     
-    def parse_holdings(self, html: str, etf_symbol: str) -> List[Holding]:
-        holdings = []
-        soup = BeautifulSoup(html, 'lxml')
-        tables = soup.find_all('table')
+    def parse_holdings(self, html: Union[str, bytes], etf_symbol: str, provider: Optional[str] = None,
+                       source_url: str = '', trade_date: Optional[date] = None) -> HoldingBatch:
+        return get_parser(provider)(html, etf_symbol, source_url, trade_date)
+    
+    def _client(self, route: str):
+        return self.direct if route == DIRECT else self.zyte
+    
+    def available_routes(self) -> List[str]:
+        return [DIRECT, ZYTE] if self.zyte.api_key else [DIRECT]
+    
+    async def _timed_fetch(self, etf: ETFConfig, route: str,
+                           request_headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        timing = self.run_log.get(etf.url)
+        outcome = 'error'
+        started = time.perf_counter()
+        try:
+            result = await self._client(route).fetch_result(etf.url, request_headers)
+            outcome = 'not_modified' if result.not_modified else 'ok'
+        finally:
+            elapsed = time.perf_counter() - started
+            self._fetch_ms[etf.url] = elapsed * 1000
+            metrics.FETCH_SECONDS.observe(elapsed, provider=etf.provider, route=route)
+            metrics.FETCHES.inc(provider=etf.provider, route=route, outcome=outcome)
+            if timing is not None:
+                timing.fetches += 1
+                timing.fetch_ms += elapsed * 1000
+        metrics.FETCH_BYTES.inc(len(result.body), provider=etf.provider, route=route)
+        if timing is not None:
+            timing.bytes_downloaded += len(result.body)
+        return result
+    
+    async def fetch_page(self, etf: ETFConfig, route: str = ZYTE) -> Optional[Union[bytes, bytearray]]:
+        """Raw page to parse, or None when it has not changed since it was last saved; raises FetchError"""
+        logger.info(f"Fetching {etf.symbol} - {etf.name} ({route})")
+        if self.page_store is None:
+            result = await self._timed_fetch(etf, route)
+            return None if result.not_modified else result.body
         
-        for table in tables:
-            rows = table.find_all('tr')
-            for row in rows[1:]:
-                cols = row.find_all(['td', 'th'])
-                if len(cols) >= 4:
-                    try:
-                        holding = Holding(
-                            etf_symbol=etf_symbol,
-                            trade_date=date.today(),
-                            holding_date=date.today(),
-                            rank=len(holdings) + 1,
-                            isin=None,
-                            issuer_name=cols[0].get_text(strip=True),
-                            security_name=cols[1].get_text(strip=True) if len(cols) > 1 else '',
-                            security_type='',
-                            shares_held=0,
-                            market_value_twd=0,
-                            weight_pct=float(cols[-1].get_text(strip=True).replace('%', '').replace(',', '')) if cols[-1].get_text(strip=True) else 0,
-                            source_url=''
-                        )
-                        holdings.append(holding)
-                    except (ValueError, IndexError):
-                        continue
+        meta = self.page_store.meta(etf.url)
+        result = await self._timed_fetch(etf, route, meta.validators() if meta else None)
+        # Page store reads and writes (gzip + file I/O) run in a thread, off the event loop
+        if result.not_modified:
+            if meta is None:
+                return None
+            self.page_store.touch(etf.url)
+            if meta.ingested:
+                logger.info(f"{etf.symbol}: not modified, skipping")
+                return None
+            body, sha = await asyncio.to_thread(self.page_store.get, meta.sha256), meta.sha256
+        else:
+            meta, changed = await asyncio.to_thread(self.page_store.put, etf.url, result.body,
+                                                    result.etag, result.last_modified)
+            if not changed:
+                logger.info(f"{etf.symbol}: page unchanged ({meta.sha256[:12]}), skipping")
+                return None
+            body, sha = result.body, meta.sha256
+        self._page_hashes[etf.url] = sha
+        return body
+    
+    async def parse_page(self, html: Union[str, bytes], etf: ETFConfig,
+                         trade_date: Optional[date] = None) -> HoldingBatch:
+        """Parse in the process pool so the event loop keeps issuing fetches; identical pages come from the cache"""
+        started = time.perf_counter()
+        parser = get_parser(etf.provider)
+        trade_date = trade_date or date.today()
+        holdings = None
+        if self.parse_cache is not None:
+            page_sha = self._page_hashes.get(etf.url) \
+                or hashlib.sha256(html.encode('utf-8') if isinstance(html, str) else html).hexdigest()
+            # SQLite and zlib run in a thread, off the event loop
+            holdings = await asyncio.to_thread(self.parse_cache.get, parser, page_sha, etf.symbol, trade_date)
+            if holdings is not None:
+                logger.info(f"{etf.symbol}: {len(holdings)} holdings from parse cache")
+        
+        cached = holdings is not None
+        if not cached:
+            if self.parse_pool is None:
+                holdings = self.parse_holdings(html, etf.symbol, etf.provider, etf.url, trade_date)
+            else:
+                loop = asyncio.get_running_loop()
+                holdings = await loop.run_in_executor(
+                    self.parse_pool, parse_page, etf.provider, html, etf.symbol, etf.url, trade_date
+                )
+            if self.parse_cache is not None and holdings:
+                await asyncio.to_thread(self.parse_cache.put, parser, page_sha, etf.symbol, trade_date, holdings)
+        
+        elapsed = time.perf_counter() - started
+        metrics.PARSE_SECONDS.observe(elapsed, provider=etf.provider, cache='hit' if cached else 'miss')
+        timing = self.run_log.get(etf.url)
+        if timing is not None:
+            timing.parse_ms += elapsed * 1000
         return holdings
     
-    async def fetch_etf(self, etf: ETFConfig) -> List[Holding]:
-        logger.info(f"Fetching {etf.symbol} - {etf.name}")
-        html = await self.zyte.fetch(etf.url)
-        if html:
-            return self.parse_holdings(html, etf.symbol)
-        return []
+    @staticmethod
+    def page_for(etf: ETFConfig, trade_date: Optional[date] = None) -> Tuple[ETFConfig, str, str]:
+        """(ETF config pointing at the page to fetch, routing key, log label) for a trade date"""
+        if trade_date is None:
+            return etf, etf.url, etf.symbol
+        if not etf.history_url:
+            raise ValueError(f"{etf.symbol} has no history_url to backfill from")
+        page = replace(etf, url=etf.history_url.format(date=trade_date))
+        return page, etf.history_url, f"{etf.symbol}@{trade_date}"
+    
+    async def fetch_etf(self, etf: ETFConfig, trade_date: Optional[date] = None) -> Optional[HoldingBatch]:
+        """
+        Walk the router's plan (direct first where it has worked) until a route yields holdings.
+        With a trade_date the page comes from etf.history_url, routed by the template.
+        Returns None when every route failed, an empty batch when the page is already ingested.
+        """
+        page, route_key, label = self.page_for(etf, trade_date)
+        host = urlsplit(page.url).hostname
+        timing = self.run_log.start(page.url, etf.symbol, trade_date or date.today())
+        for route in self.router.plan(etf.provider, route_key, self.available_routes()):
+            timing.route = route
+            # Only each network attempt holds a scheduler slot; backoff sleeps and parsing run outside it
+            try:
+                html = await call_with_retries(
+                    self.fetch_scheduler.submit, etf.provider, etf.priority, self.fetch_page, page, route,
+                    policy=self.retry_policy, breakers=self.breakers,
+                    keys=(f"{route}:etf:{etf.symbol}",), host_keys=(f"{route}:host:{host}",),
+                    label=f"{label} ({route})",
+                )
+            except FetchError as e:
+                self.router.record(etf.provider, route_key, route, False, self._fetch_ms.get(page.url, 0.0))
+                logger.warning(f"{label}: {route} fetch failed - {e}")
+                continue
+            # None means the page is byte-identical to one already ingested, which is a success
+            if html is None:
+                self.router.record(etf.provider, route_key, route, True, self._fetch_ms.get(page.url, 0.0))
+                timing.finish('success')
+                return HoldingBatch(etf.symbol, trade_date or date.today(), source_url=page.url)
+            holdings = await self.parse_page(html, page, trade_date)
+            self.router.record(etf.provider, route_key, route, bool(holdings), self._fetch_ms.get(page.url, 0.0))
+            if holdings:
+                # Finished by save_holdings once committed
+                timing.holdings_count = len(holdings)
+                return holdings
+            logger.info(f"{label}: no holdings in {route} page, trying next route")
+        logger.error(f"{label}: every route failed")
+        timing.finish('failed', 'every route failed')
+        return None
+    
+    async def _fetch_tagged(self, etf: ETFConfig) -> Tuple[str, Optional[HoldingBatch]]:
+        """One ETF's failure is logged and counted, never allowed to sink the whole run"""
+        try:
+            return etf.symbol, await self.fetch_etf(etf)
+        except Exception as e:
+            logger.exception(f"{etf.symbol}: fetch/parse failed")
+            timing = self.run_log.get(etf.url)
+            if timing is not None:
+                timing.finish('failed', repr(e))
+            return etf.symbol, None
+    
+    async def fetch_all(self) -> Dict[str, Optional[HoldingBatch]]:
+        if self.session is None:
+            async with self:
+                return await self.fetch_all()
+        results = await asyncio.gather(*(self.fetch_etf(etf) for etf in self.etfs))
+        return dict(zip([e.symbol for e in self.etfs], results))
+    
+    def save_queue(self) -> asyncio.Queue:
+        """
+        Hand-off queue for _save_worker, bounded at save_batch_size so fetches wait
+        for the saver instead of piling up snapshots (and, with a coordinator, the
+        claim connections held until each one commits)
+        """
+        return asyncio.Queue(maxsize=self.config.get('scraping', {}).get('save_batch_size', 20))
+    
+    @staticmethod
+    async def feed_saver(saver: asyncio.Task, producer: Awaitable):
+        """Await producer, a writer to saver's bounded queue; if the saver dies first, cancel it and raise its error"""
+        producer = asyncio.ensure_future(producer)
+        try:
+            await asyncio.wait({producer, saver}, return_when=asyncio.FIRST_COMPLETED)
+            if not producer.done():
+                saver.result()
+            return producer.result()
+        finally:
+            if not producer.done():
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+    
+    async def _save_worker(self, queue: asyncio.Queue,
+                           on_saved: Optional[Callable[[List[HoldingBatch]], None]] = None):
+        """
+        Save parsed snapshots as they arrive, batching whatever queued up during the last save.
+        on_saved runs (in the saver thread) after each committed batch.
+        """
+        batch_size = self.config.get('scraping', {}).get('save_batch_size', 20)
+        batch: Dict[Tuple[str, date], HoldingBatch] = {}
+        self._save_queues.append(queue)
+        try:
+            while True:
+                item = await queue.get()
+                if item is not None:
+                    batch[(item.etf_symbol, item.trade_date)] = item
+                if batch and (item is None or len(batch) >= batch_size or queue.empty()):
+                    await asyncio.to_thread(self.save_holdings, batch)
+                    if on_saved is not None:
+                        await asyncio.to_thread(on_saved, list(batch.values()))
+                    self._mark_ingested(batch)
+                    batch = {}
+                if item is None:
+                    return
+        finally:
+            self._save_queues.remove(queue)
     
-    async def fetch_all(self) -> Dict[str, List[Holding]]:
-        async with aiohttp.ClientSession() as session:
-            tasks = [self.fetch_etf(etf) for etf in self.etfs]
-            results = await asyncio.gather(*tasks)
-            return dict(zip([e.symbol for e in self.etfs], results))
+    def save_queue_depth(self) -> int:
+        """Parsed snapshots waiting for the savers"""
+        return sum(q.qsize() for q in self._save_queues)
     
-    def save_holdings(self, holdings_dict: Dict[str, List[Holding]]):
+    def _mark_ingested(self, holdings_dict: Dict[Tuple[str, date], HoldingBatch]):
+        """Remember which page versions are in the database so identical re-fetches skip"""
+        if self.page_store is None:
+            return
+        for holdings in holdings_dict.values():
+            sha = self._page_hashes.pop(holdings.source_url, None)
+            if sha is not None:
+                self.page_store.mark_ingested(holdings.source_url, sha)
+    
+    def save_holdings(self, holdings_dict: Dict[Tuple[str, date], HoldingBatch]) -> LoadStats:
         conn = self._get_db_connection()
-        with conn.cursor() as cursor:
-            total = 0
-            for symbol, holdings in holdings_dict.items():
-                for h in holdings:
-                    cursor.execute('''
-                        INSERT INTO etf_holdings 
-                        (etf_symbol, trade_date, holding_date, rank, isin, 
-                         issuer_name, security_name, security_type,
-                         shares_held, market_value_twd, weight_pct, source_url)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ''', (
-                        h.etf_symbol, h.trade_date, h.holding_date, h.rank, h.isin,
-                        h.issuer_name, h.security_name, h.security_type,
-                        h.shares_held, h.market_value_twd, h.weight_pct, h.source_url
-                    ))
-                    total += 1
+        try:
+            stats = bulk_load_holdings(conn, holdings_dict.values())
+        finally:
+            conn.close()
+        metrics.SAVE_SECONDS.observe(stats.seconds)
+        metrics.SAVE_ROWS_PER_SEC.set(stats.rows_per_sec)
+        for operation, rows in (('insert', stats.inserted), ('update', stats.updated), ('delete', stats.deleted)):
+            metrics.ROWS_WRITTEN.inc(rows, operation=operation)
+        # The load is one transaction; each snapshot is charged its share of rows
+        for holdings in holdings_dict.values():
+            timing = self.run_log.get(holdings.source_url)
+            if timing is not None:
+                timing.rows_saved = stats.written.get((holdings.etf_symbol, holdings.trade_date), 0)
+                timing.db_ms = stats.seconds * 1000 * len(holdings) / max(stats.copied, 1)
+                timing.finish('success')
+        logger.info(f"Saved {len(holdings_dict)} ETF snapshots: {stats.inserted} new, "
+                    f"{stats.updated} updated, {stats.deleted} removed, "
+                    f"{stats.unchanged} unchanged, {stats.changes} holding changes "
+                    f"({stats.copied} rows in {stats.seconds:.2f}s, "
+                    f"{stats.rows_per_sec:,.0f} rows/sec)")
+        return stats
+    
+    async def _run_claimed(self, etfs: List[ETFConfig], coordinator: Coordinator,
+                           claims: Dict[str, Claim], queue: asyncio.Queue,
+                           counts: Dict[str, Optional[int]], logged: List[UnitTiming]):
+        """
+        Multi-node mode: max_concurrency workers each claim the next free ETF, so
+        nodes started together split the list instead of all grabbing everything.
+        A unit stays claimed until its holdings are committed.
+        """
+        pending = deque(etfs)
+        today = date.today()
+        
+        async def worker():
+            while pending:
+                etf = pending.popleft()
+                claim = await asyncio.to_thread(coordinator.claim, etf.symbol, today)
+                if claim.state != CLAIMED:
+                    # Done elsewhere counts as success; held elsewhere stays unconfirmed (None)
+                    logger.info(f"{etf.symbol}: {claim.state} on another node, skipping")
+                    counts[etf.symbol] = 0 if claim.state == DONE else None
+                    continue
+                symbol, holdings = await self._fetch_tagged(etf)
+                counts[symbol] = None if holdings is None else len(holdings)
+                if holdings:
+                    claims[symbol] = claim
+                    await queue.put(holdings)
+                else:
+                    timing = self.run_log.finish(etf.url, 'failed' if holdings is None else 'success', etf_symbol=etf.symbol)
+                    await asyncio.to_thread(coordinator.complete, claim, timing.status, 0, timing=timing)
+                    logged.append(timing)
+        
+        workers = self.config.get('scraping', {}).get('max_concurrency', 8)
+        await asyncio.gather(*(worker() for _ in range(min(workers, len(etfs)))))
+    
+    def _complete_claims(self, coordinator: Coordinator, claims: Dict[str, Claim],
+                         batches: List[HoldingBatch], logged: List[UnitTiming]):
+        for holdings in batches:
+            claim = claims.pop(holdings.etf_symbol, None)
+            if claim is not None:
+                timing = self.run_log.finish(holdings.source_url, 'success')
+                coordinator.complete(claim, 'success', len(holdings), timing=timing)
+                logged.append(timing)
+    
+    def _write_log(self, timings: List[UnitTiming], node_id: Optional[str] = None):
+        """One INSERT for the whole run's etf_scrape_log rows"""
+        conn = self._get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                write_log(cursor, timings, 'daily', node_id)
             conn.commit()
-        conn.close()
-        logger.info(f"Saved {total} holdings for {len(holdings_dict)} ETFs")
+        finally:
+            conn.close()
     
-    async def run(self):
-        logger.info("Starting ETF holdings fetch...")
-        holdings = await self.fetch_all()
-        self.save_holdings(holdings)
+    async def run(self, etfs: Optional[List[ETFConfig]] = None,
+                  coordinator: Optional[Coordinator] = None) -> Dict[str, Optional[int]]:
+        """
+        Fetch -> parse (process pool) -> save, with each stage streaming into the next.
+        Runs every configured ETF unless given a subset; returns holdings saved per
+        ETF, None for ETFs that failed (or that another node holds, with a coordinator).
+        Reuses the session and pool if already open.
+        """
+        etfs = self.etfs if etfs is None else etfs
+        logger.info(f"Starting ETF holdings fetch for {len(etfs)} ETFs...")
+        loop_mark = self.monitor_loop()
+        counts: Dict[str, Optional[int]] = {}
+        queue = self.save_queue()
+        claims: Dict[str, Claim] = {}
+        logged: List[UnitTiming] = []   # written one by one as claims complete
+        on_saved = None
+        if coordinator is not None:
+            on_saved = lambda batches: self._complete_claims(coordinator, claims, batches, logged)
+        
+        async def fetch_all():
+            for done in asyncio.as_completed([self._fetch_tagged(etf) for etf in etfs]):
+                symbol, holdings = await done
+                counts[symbol] = None if holdings is None else len(holdings)
+                if holdings:
+                    await queue.put(holdings)
+        
+        async with (self if self.session is None else contextlib.nullcontext(self)):
+            saver = asyncio.create_task(self._save_worker(queue, on_saved))
+            try:
+                if coordinator is not None:
+                    await self.feed_saver(saver, self._run_claimed(etfs, coordinator, claims, queue, counts, logged))
+                else:
+                    await self.feed_saver(saver, fetch_all())
+            finally:
+                try:
+                    await self.feed_saver(saver, queue.put(None))
+                    await saver
+                finally:
+                    # Claims whose save never committed go back to the pool unlogged
+                    for symbol, claim in claims.items():
+                        counts[symbol] = None
+                        coordinator.release(claim)
+                    if self.page_store is not None:
+                        await asyncio.to_thread(self.page_store.flush)
+                    self.router.save()
+                    timings = self.run_log.take(etf.url for etf in etfs)
+                    try:
+                        await asyncio.to_thread(self._write_log, timings,
+                                                coordinator.node_id if coordinator is not None else None)
+                    except Exception:
+                        logger.exception("Could not write etf_scrape_log")
         
-        for symbol, h in holdings.items():
-            logger.info(f"{symbol}: {len(h)} holdings")
+        report(logged + timings)
+        self.loop_report(loop_mark)
+        for symbol, n in counts.items():
+            logger.info(f"{symbol}: {'FAILED' if n is None else f'{n} holdings'}")
+        for provider, routes in self.router.summary().items():
+            for route, stats in routes.items():
+                logger.info(f"{provider}/{route}: {stats.successes}/{stats.attempts} ok, "
+                            f"~{stats.latency_ms:.0f} ms")
+        return counts
 
 if __name__ == "__main__":
     scraper = ETFScraper()
@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from page_store import PageStore
+
+URL = 'https://example.com/etf/00919'
+
+def age(store: PageStore, sha: str, days: float):
+    path = store._object_path(sha)
+    then = time.time() - days * 86400
+    os.utime(path, (then, then))
+
+def test_prune_keeps_pages_the_index_points_at(tmp_path):
+    store = PageStore(str(tmp_path), max_age_days=30)
+    old, _ = store.put(URL, b'<html>v1</html>')
+    store.mark_ingested(URL, old.sha256)
+    new, _ = store.put(URL, b'<html>v2</html>')
+    stale, _ = store.put('https://example.com/etf/00929', b'<html>x</html>')
+    store.put('https://example.com/etf/00929', b'<html>y</html>')
+    for meta in (old, new, stale):
+        age(store, meta.sha256, 60)
+
+    assert store.prune() == 1
+    assert not os.path.exists(store._object_path(stale.sha256))
+    assert store.get(old.sha256) == b'<html>v1</html>'    # still the ingested version
+    assert store.get(new.sha256) == b'<html>v2</html>'
+
+def test_prune_spares_recent_objects_and_is_off_by_default(tmp_path):
+    store = PageStore(str(tmp_path))
+    meta, _ = store.put(URL, b'<html>v1</html>')
+    store.put(URL, b'<html>v2</html>')
+    age(store, meta.sha256, 365)
+    assert store.prune() == 0
+    store.max_age_days = 400
+    assert store.prune() == 0
+
+def test_save_writes_the_index_only_when_changed(tmp_path):
+    store = PageStore(str(tmp_path))
+    store.save()
+    assert not os.path.exists(store.index_path)
+    meta, _ = store.put(URL, b'<html>v1</html>')
+    store.flush()
+    with open(store.index_path) as f:
+        assert json.load(f)[URL]['sha256'] == meta.sha256
+    mtime = os.path.getmtime(store.index_path)
+    os.utime(store.index_path, (mtime - 10, mtime - 10))
+    store.save()
+    assert os.path.getmtime(store.index_path) == mtime - 10
+    assert PageStore(str(tmp_path)).meta(URL).sha256 == meta.sha256
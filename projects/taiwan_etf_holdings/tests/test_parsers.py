@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nuxt_state import NuxtState, NuxtStateError, extract_nuxt_state
+from parsers import parse_yuanta_holdings
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+TABLE = ('<table><tr><th>code</th><th>name</th><th>shares</th><th>weight</th></tr>'
+         '<tr><td>2330</td><td>TSMC</td><td>1,000</td><td>9.5%</td></tr></table>')
+
+def test_yuanta_holdings_from_nuxt_state():
+    batch = parse_yuanta_holdings(fixture('yuanta_00929_holdings.html'), '00929')
+    assert len(batch) == 10
+    assert batch.isin[:3] == ['TW0002330008', 'TW0002454006', 'TW0002317005']
+    assert batch.security_name[0] == '台積電'
+    assert batch.security_type[0] == '股票'        # bound through an IIFE parameter
+    assert batch.shares_held[0] == 1234000
+    assert batch.market_value_twd[0] == 1271020000
+    assert batch.weight_pct[0] == 8.52
+    assert batch.weight_pct[6] == 2.31            # "2.31%"
+    assert batch.weight_pct[8] == 0.49            # .49 argument
+
+def test_yuanta_tolerates_placeholder_cells():
+    batch = parse_yuanta_holdings(fixture('yuanta_00929_holdings.html'), '00929')
+    assert list(batch.rank) == list(range(1, 11))  # "3.0" and a void 0 rank included
+    assert batch.shares_held[5] == 0 and batch.market_value_twd[5] == 0   # "-"
+    assert batch.market_value_twd[6] == 0         # ""
+    assert batch.weight_pct[9] == 0               # "-"
+
+@pytest.mark.parametrize('script', [
+    'window.__NUXT__=(function(a){x.k=1;return {data:[]}}(1));',     # unknown assignment target
+    'window.__NUXT__=(function(a',                                     # truncated parameter list
+    'window.__NUXT__=(function(a){return {StockWeights:[b]}}(1));',    # unbound identifier
+])
+def test_unreadable_state_falls_back_to_tables(script):
+    page = f'<html><body>{TABLE}<script>{script}</script></body></html>'
+    batch = parse_yuanta_holdings(page, '00929')
+    assert batch.isin == ['TW0002330008']
+    assert batch.weight_pct[0] == 9.5
+
+def test_evaluator_errors_are_nuxt_state_errors():
+    with pytest.raises(NuxtStateError):
+        NuxtState('window.__NUXT__=(function(a){x.k=1;return {}}(1))')
+    state = extract_nuxt_state('<script>window.__NUXT__={data:[{StockWeights:[{code:"1",w:1}</script>')
+    with pytest.raises(NuxtStateError):
+        state.find(['StockWeights'])
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resilience import CircuitBreakers, CircuitOpenError, FetchError, RetryPolicy, call_with_retries
+
+ETF = 'zyte:etf:00919'
+HOST = 'zyte:host:www.yuantaetfs.com'
+
+def open_circuit(breakers: CircuitBreakers, key: str, age: float):
+    """Open key's circuit as if its last failure was age seconds ago"""
+    for _ in range(breakers.failure_threshold):
+        breakers.record_failure(key)
+    breakers._circuits[key].opened_at -= age
+
+def test_open_host_gives_back_etf_trial():
+    breakers = CircuitBreakers(failure_threshold=2, reset_timeout=60)
+    open_circuit(breakers, ETF, 61)     # half-open: one trial allowed
+    open_circuit(breakers, HOST, 0)     # open
+    calls = []
+    
+    async def fetch():
+        calls.append(1)
+        return 'page'
+    
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call_with_retries(fetch, policy=RetryPolicy(1), breakers=breakers, keys=(ETF,), host_keys=(HOST,)))
+    assert not calls
+    assert not breakers._circuits[ETF].trial_in_flight
+    
+    # Once the host recovers, the ETF's trial is still available
+    breakers.record_success(HOST)
+    result = asyncio.run(call_with_retries(fetch, policy=RetryPolicy(1), breakers=breakers, keys=(ETF,), host_keys=(HOST,)))
+    assert result == 'page'
+    assert breakers.state(ETF) == 'closed'
+
+def test_half_open_allows_a_single_trial():
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=60)
+    open_circuit(breakers, ETF, 61)
+    assert breakers.check(ETF) is True
+    with pytest.raises(CircuitOpenError):
+        breakers.check(ETF)
+    breakers.record_failure(ETF)
+    assert breakers.state(ETF) == 'open'
+
+def test_non_retryable_error_is_not_retried():
+    breakers = CircuitBreakers(failure_threshold=5)
+    calls = []
+    
+    async def fetch():
+        calls.append(1)
+        raise FetchError('HTTP 404', 404, retryable=False)
+    
+    with pytest.raises(FetchError):
+        asyncio.run(call_with_retries(fetch, policy=RetryPolicy(3, 0, 0), breakers=breakers, keys=(ETF,)))
+    assert len(calls) == 1
+
+def test_non_retryable_errors_spare_the_host_breaker():
+    breakers = CircuitBreakers(failure_threshold=2, reset_timeout=60)
+    
+    async def fetch(status, retryable):
+        raise FetchError(f'HTTP {status}', status, retryable=retryable)
+    
+    for symbol in ('00919', '00929', '00940'):
+        with pytest.raises(FetchError):
+            asyncio.run(call_with_retries(fetch, 404, False, policy=RetryPolicy(1), breakers=breakers,
+                                          keys=(f'zyte:etf:{symbol}',), host_keys=(HOST,)))
+    assert breakers.state(HOST) == 'closed'
+    
+    for symbol in ('00950', '00960'):
+        with pytest.raises(FetchError):
+            asyncio.run(call_with_retries(fetch, 503, True, policy=RetryPolicy(1), breakers=breakers,
+                                          keys=(f'zyte:etf:{symbol}',), host_keys=(HOST,)))
+    assert breakers.state(HOST) == 'open'
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+TWSE trading calendar
+Weekdays are sessions unless the holiday file lists them as closed; a
+weekend listed as open is a make-up session. Years the file does not
+cover fall back to Monday-Friday (with a warning), so a stale file never
+stops the scraper outright.
+"""
+
+import csv
+import os
+import logging
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'twse_holidays.csv')
+
+class TradingCalendar:
+    def __init__(self, overrides: Dict[date, bool]):
+        # date -> is a session, for every date that differs from the weekday rule
+        self.overrides = overrides
+        self.years = {d.year for d in overrides}
+        self._warned = set()
+    
+    def covers(self, year: int) -> bool:
+        """Whether the holiday file lists the year; warns (once per year) when it does not"""
+        if year in self.years:
+            return True
+        if year not in self._warned:
+            self._warned.add(year)
+            logger.warning(f"Trading calendar has no entries for {year}; assuming Monday-Friday")
+        return False
+    
+    def is_trading_day(self, day: date) -> bool:
+        if day in self.overrides:
+            return self.overrides[day]
+        self.covers(day.year)
+        return day.weekday() < 5
+    
+    def sessions(self, start: date, end: date) -> List[date]:
+        """Trading days from start to end inclusive"""
+        return [d for d in _days(start, end) if self.is_trading_day(d)]
+    
+def _days(start: date, end: date) -> Iterator[date]:
+    for i in range((end - start).days + 1):
+        yield start + timedelta(days=i)
+
+@lru_cache(maxsize=4)
+def _load(path: str, mtime: float) -> TradingCalendar:
+    overrides: Dict[date, bool] = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = csv.DictReader(line for line in f if line.strip() and not line.startswith('#'))
+        for row in rows:
+            overrides[date.fromisoformat(row['date'].strip())] = row['status'].strip().lower() == 'open'
+    logger.info(f"Loaded trading calendar {path} ({len(overrides)} entries)")
+    return TradingCalendar(overrides)
+
+def load_calendar(path: str = DEFAULT_PATH) -> TradingCalendar:
+    """Parsed calendar, cached until the file changes; warns if it does not cover the current year"""
+    if not os.path.exists(path):
+        logger.warning(f"Trading calendar {path} not found; assuming Monday-Friday")
+        return TradingCalendar({})
+    calendar = _load(os.path.abspath(path), os.path.getmtime(path))
+    calendar.covers(date.today().year)
+    return calendar
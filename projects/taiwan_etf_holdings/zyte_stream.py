@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Incremental decoding of Zyte API responses
+The base64 httpResponseBody is decoded chunk by chunk straight into one
+bytearray as the response streams in; only the small remainder of the
+JSON document (status code, headers) is buffered and parsed.
+"""
+
+import binascii
+import json
+import re
+from typing import Any, Dict
+
+_BODY_START_RE = re.compile(rb'"httpResponseBody"\s*:\s*"')
+# Longest tail that could hold a partial match of _BODY_START_RE
+_LOOKBEHIND = 64
+
+class ZyteResponseDecoder:
+    def __init__(self):
+        self.body = bytearray()
+        self._meta = bytearray()
+        self._pending = b''
+        self._in_body = False
+        self._seen_body = False
+        self._scan_from = 0
+    
+    def feed(self, chunk: bytes):
+        while chunk:
+            if self._in_body:
+                end = chunk.find(b'"')
+                self._decode(chunk if end < 0 else chunk[:end])
+                if end < 0:
+                    return
+                self._decode_pending()
+                self._in_body = False
+                self._meta += b'""'
+                chunk = chunk[end + 1:]
+                continue
+            
+            self._meta += chunk
+            if self._seen_body:
+                return
+            m = _BODY_START_RE.search(self._meta, self._scan_from)
+            if m is None:
+                self._scan_from = max(0, len(self._meta) - _LOOKBEHIND)
+                return
+            chunk = bytes(self._meta[m.end():])
+            del self._meta[m.end() - 1:]
+            self._in_body = self._seen_body = True
+    
+    def _decode(self, data: bytes):
+        # JSON may escape '/' as '\/'; base64 never contains a backslash
+        if b'\\' in data:
+            data = data.replace(b'\\', b'')
+        if self._pending:
+            data = self._pending + data
+        aligned = len(data) - len(data) % 4
+        if aligned:
+            self.body += binascii.a2b_base64(data[:aligned])
+        self._pending = data[aligned:]
+    
+    def _decode_pending(self):
+        if self._pending:
+            self.body += binascii.a2b_base64(self._pending)
+            self._pending = b''
+    
+    def finish(self) -> Dict[str, Any]:
+        """The response document with httpResponseBody emptied (its bytes are in .body)"""
+        if self._in_body:
+            raise ValueError("Zyte response ended inside httpResponseBody")
+        return json.loads(bytes(self._meta))